@@ -0,0 +1,133 @@
+# aggregates.py
+# ------------------------------------------------------------
+# Report totals maintained as transactions happen.
+#
+# Stored with the library data:
+#   - Meta "TotalFine":   sum of Fine over the live Transactions
+#   - Meta "ActiveLoans": number of books currently issued
+#   - Members.BooksIssued: books currently issued per member
+#
+# TransactionManager updates these in the same commit as the issue
+# or return, so the Reports menu can answer without a scan. verify()
+# and rebuild() recompute them from the raw rows, loaded as a
+# columnar models.TransactionTable.
+#
+# A library that has never stored them gets them with its first issue
+# or return; until then the reports compute them from the rows, since
+# a read must never leave uncommitted changes behind. Reports read the
+# Meta values in one pass (storage.meta_items()), which on a cold Excel
+# library is one stream of the sheet rather than one per key.
+# ------------------------------------------------------------
+
+from models import TransactionTable
+
+
+class ReportAggregates:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _number(self, key):
+        return self.storage.get_meta(key, 0) or 0
+
+    def is_stored(self):
+        return self.storage.get_meta("ActiveLoans") is not None
+
+    def ensure(self):
+        """Builds the aggregates from raw rows if this library has never had them.
+
+        Writes without saving; call it only inside a change that is
+        committed (e.g. under run_with_retry).
+        """
+        if not self.is_stored():
+            self.rebuild(commit=False)
+
+    def stored_totals(self):
+        """Returns the stored (total fine, active loans) from one read, or None if never stored."""
+        meta = self.storage.meta_items()
+        if meta.get("ActiveLoans") is None:
+            return None
+        return meta.get("TotalFine") or 0, meta["ActiveLoans"]
+
+    def total_fine(self):
+        """Returns the live fine total without changing anything."""
+        totals = self.stored_totals()
+        return self.compute()[0] if totals is None else totals[0]
+
+    def active_loans(self):
+        """Returns the number of books currently issued without changing anything."""
+        totals = self.stored_totals()
+        return self.compute()[1] if totals is None else totals[1]
+
+    def _adjust_member(self, member_id, delta):
+        row = self.storage.get_row("Members", member_id)
+        if row is not None:
+            self.storage.update_row("Members", member_id, {"BooksIssued": max((row[3] or 0) + delta, 0)})
+
+    def record_issue(self, member_id):
+        """Counts a new loan. Call before the transaction row is added."""
+        self.ensure()
+        self.storage.set_meta("ActiveLoans", self._number("ActiveLoans") + 1)
+        self._adjust_member(member_id, +1)
+
+    def record_return(self, member_id, fine):
+        """Counts a returned loan and its fine. Call before the transaction row is updated."""
+        self.ensure()
+        self.storage.set_meta("ActiveLoans", max(self._number("ActiveLoans") - 1, 0))
+        self.storage.set_meta("TotalFine", self._number("TotalFine") + (fine or 0))
+        self._adjust_member(member_id, -1)
+
+    def record_archive(self, archived_fine):
+        """Removes fines of archived transactions from the live total. Call before deleting them."""
+        self.ensure()
+        self.storage.set_meta("TotalFine", self._number("TotalFine") - (archived_fine or 0))
+
+    def record_fine_change(self, delta):
+        """Moves the live fine total after stored fines were re-priced."""
+        self.ensure()
+        self.storage.set_meta("TotalFine", self._number("TotalFine") + (delta or 0))
+
+    def compute(self):
+        """Recomputes every aggregate from the raw rows.
+
+        Returns (total fine, active loans, {member ID: open loans}).
+        """
+        table = TransactionTable.load(self.storage)
+        per_member = table.open_counts("member_ids")
+        return table.total_fine(), sum(per_member.values()), per_member
+
+    def _drift(self, total_fine, active_loans, per_member):
+        drift = []
+        meta = self.storage.meta_items()
+        if meta.get("TotalFine") != total_fine:
+            drift.append(("TotalFine", meta.get("TotalFine"), total_fine))
+        if meta.get("ActiveLoans") != active_loans:
+            drift.append(("ActiveLoans", meta.get("ActiveLoans"), active_loans))
+        for row in self.storage.get_rows("Members"):
+            actual = per_member.get(str(row[0]), 0)
+            if (row[3] or 0) != actual:
+                drift.append((f"Member {row[0]} BooksIssued", row[3], actual))
+        return drift
+
+    def verify(self):
+        """Compares the stored aggregates with the raw rows.
+
+        Returns a list of (name, stored, actual) for every mismatch.
+        """
+        return self._drift(*self.compute())
+
+    def rebuild(self, commit=True):
+        """Overwrites the stored aggregates with values recomputed from raw rows.
+
+        Returns the drift that was corrected.
+        """
+        total_fine, active_loans, per_member = self.compute()
+        drift = self._drift(total_fine, active_loans, per_member)
+        self.storage.set_meta("TotalFine", total_fine)
+        self.storage.set_meta("ActiveLoans", active_loans)
+        for row in list(self.storage.get_rows("Members")):
+            actual = per_member.get(str(row[0]), 0)
+            if (row[3] or 0) != actual:
+                self.storage.update_row("Members", row[0], {"BooksIssued": actual})
+        if commit:
+            self.storage.commit()
+        return drift
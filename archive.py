@@ -0,0 +1,136 @@
+# archive.py
+# ------------------------------------------------------------
+# Archival of closed transactions into per-year workbooks.
+#
+# Returned loans older than a cutoff are moved out of the live
+# Transactions sheet into archive/transactions_<year>.xlsx (by
+# return year), so issue, return and reports only pay for open and
+# recent loans. Reports can still read the archive when asked.
+# ------------------------------------------------------------
+
+import os
+import glob
+from datetime import date, timedelta
+
+from models import parse_date
+from aggregates import ReportAggregates
+from storage import StaleWorkbookError
+from filelock import LockTimeout
+
+# -------- CONFIGURATION --------
+ARCHIVE_DIR = "archive"
+
+# Returned transactions older than this many days are archived
+ARCHIVE_AFTER_DAYS = 365
+# -------------------------------
+
+
+class TransactionArchiver:
+    def __init__(self, storage, archive_dir=ARCHIVE_DIR):
+        self.storage = storage
+        self.archive_dir = archive_dir
+        self.sheet_name = "Transactions"
+        self.headers = storage.required_sheets[self.sheet_name]
+
+    def archive_file(self, year):
+        return os.path.join(self.archive_dir, f"transactions_{year}.xlsx")
+
+    def archive_files(self):
+        """Returns the existing per-year archive files, oldest first."""
+        return sorted(glob.glob(os.path.join(self.archive_dir, "transactions_*.xlsx")))
+
+    def _append_to_year(self, year, rows):
+        """Appends rows to one year's archive, skipping IDs already there."""
+        from openpyxl import Workbook, load_workbook
+
+        path = self.archive_file(year)
+        if os.path.exists(path):
+            wb = load_workbook(path)
+            ws = wb[self.sheet_name]
+            existing = {str(r[0]) for r in ws.iter_rows(min_row=2, max_col=1, values_only=True)}
+        else:
+            wb = Workbook()
+            ws = wb.active
+            ws.title = self.sheet_name
+            ws.append(self.headers)
+            existing = set()
+
+        for row in rows:
+            # A crash after writing the archive but before the live sheet
+            # was saved leaves rows in both; re-archiving must not duplicate.
+            if str(row[0]) not in existing:
+                ws.append(list(row))
+        wb.save(path)
+
+    def archive_closed(self, older_than_days=ARCHIVE_AFTER_DAYS, today=None):
+        """Moves returned transactions older than the cutoff into the archive.
+
+        Returns {year: rows archived}.
+        """
+        cutoff = (today or date.today()) - timedelta(days=older_than_days)
+        by_year = {}
+        for row in self.storage.get_rows(self.sheet_name):
+            returned = parse_date(row[4])
+            if returned is not None and returned < cutoff:
+                by_year.setdefault(returned.year, []).append(row)
+        if not by_year:
+            return {}
+
+        # Archive files are written first; only then are rows removed
+        # from the live sheet.
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for year, rows in sorted(by_year.items()):
+            self._append_to_year(year, rows)
+
+        keys = [row[0] for rows in by_year.values() for row in rows]
+        # Remember the highest archived ID so new transactions never reuse it
+        numeric_ids = [int(key) for key in keys if str(key).isdigit()]
+        if numeric_ids and max(numeric_ids) > int(self.storage.get_meta("ArchivedMaxTransactionID", 0) or 0):
+            self.storage.set_meta("ArchivedMaxTransactionID", max(numeric_ids))
+        archived_fine = sum(row[5] for rows in by_year.values() for row in rows
+                            if isinstance(row[5], (int, float)))
+        ReportAggregates(self.storage).record_archive(archived_fine)
+        self.storage.delete_rows(self.sheet_name, keys)
+        self.storage.commit()
+        return {year: len(rows) for year, rows in by_year.items()}
+
+    def iter_archived_rows(self):
+        """Yields every archived transaction, streaming each year's file read-only."""
+        from openpyxl import load_workbook
+
+        width = len(self.headers)
+        for path in self.archive_files():
+            wb = load_workbook(path, read_only=True)
+            try:
+                for row in wb[self.sheet_name].iter_rows(min_row=2, max_col=width, values_only=True):
+                    if any(v is not None and v != "" for v in row):
+                        yield row
+            finally:
+                wb.close()
+
+    def archive_menu(self):
+        """Asks for a cutoff and archives closed transactions."""
+        days = input(f"Archive returned transactions older than how many days? [{ARCHIVE_AFTER_DAYS}]: ").strip()
+        try:
+            days = int(days) if days else ARCHIVE_AFTER_DAYS
+        except ValueError:
+            print("\n[ERROR] Please enter a number of days.\n")
+            return
+
+        try:
+            # Archive files skip IDs already there, so a retry after another
+            # process saved first is safe.
+            moved = self.storage.run_with_retry(lambda: self.archive_closed(days))
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and the archive files and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
+
+        if not moved:
+            print("\n[INFO] No closed transactions older than the cutoff.\n")
+            return
+        for year, count in sorted(moved.items()):
+            print(f" - {count} transaction(s) -> {self.archive_file(year)}")
+        print(f"\n[SUCCESS] Archived {sum(moved.values())} transaction(s).\n")
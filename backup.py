@@ -1,48 +1,422 @@
 # backup.py
+# ------------------------------------------------------------
+# Content-addressed backups of the data files.
+#
+# Every backup is a small JSON manifest under backups/snapshots/
+# listing the files it holds. File content is split into pieces that
+# are stored once under backups/objects/, named by their SHA-256 and
+# zlib-compressed:
+#   - .xlsx files are split by workbook part (one per sheet, styles,
+#     ...), so a sheet that did not change since the last backup is
+#     not stored again;
+#   - other files (library.db, the journal, the sequence file) are
+#     split into fixed-size chunks.
+# Restore rebuilds each file of a snapshot from its manifest.
+#
+# A retention policy keeps the newest snapshot of each of the last
+# KEEP_HOURLY hours, KEEP_DAILY days and KEEP_WEEKLY weeks; pieces no
+# remaining manifest refers to are then deleted.
+#
+# Older backup_<timestamp> folders made by plain copying are still
+# listed and restorable, and are never removed by the policy.
+#
+# With a storage engine attached, its files are captured through
+# storage.snapshot_data(), a point-in-time copy taken under the
+# library lock; hashing, compressing and writing then happen without
+# holding it. A restore hands them back through storage.restore_data(),
+# which writes them under the same lock and drops what the running
+# app had loaded. BackupScheduler runs this every BACKUP_INTERVAL seconds
+# on a background thread and logs each run to backups/backup.log.
+# ------------------------------------------------------------
+
 import os
-import shutil
 import datetime
+import hashlib
+import io
+import json
+import threading
+import time
+import zlib
+import zipfile
+
+from filelock import FileLock
+
+# -------- CONFIGURATION --------
+# Size of the pieces non-xlsx files are split into
+CHUNK_SIZE = 64 * 1024
+COMPRESSION_LEVEL = 6
+
+# Retention policy: newest snapshot per hour / day / week kept
+KEEP_HOURLY = 24
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+# Seconds between scheduled backups; 0 turns the scheduler off
+BACKUP_INTERVAL = 3600
+# Apply the retention policy after every scheduled backup
+PRUNE_AFTER_BACKUP = True
+# -------------------------------
+
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
 
 class BackupManager:
-    def __init__(self, backup_dir="backups", files_to_backup=["library.xlsx", "users.xlsx"]):
+    def __init__(self, backup_dir="backups", files_to_backup=["library.xlsx", "users.xlsx"], storage=None):
         self.backup_dir = backup_dir
         self.files_to_backup = files_to_backup
+        # Engine whose files are copied with snapshot_data() instead of from disk
+        self.storage = storage
+        self.scheduler = None
+        # Sidecar journal written by LibraryStorage in journal mode
+        self.journal_file = "library.xlsx.journal"
+        # Sidecar holding the Excel engine's ID sequences
+        self.sequence_file = "library.xlsx.seq"
+        self.objects_dir = os.path.join(backup_dir, "objects")
+        self.snapshots_dir = os.path.join(backup_dir, "snapshots")
+        self.log_file = os.path.join(backup_dir, "backup.log")
 
     def ensure_backup_dir(self):
         """Ensures the main backup directory exists."""
-        if not os.path.exists(self.backup_dir):
-            os.makedirs(self.backup_dir)
+        for path in (self.backup_dir, self.objects_dir, self.snapshots_dir):
+            if not os.path.exists(path):
+                os.makedirs(path)
 
-    def backup_data(self):
-        """Creates a timestamped backup of the data files."""
+    def _lock(self):
+        """Keeps a backup from writing pieces while unreferenced ones are deleted."""
+        return FileLock(os.path.join(self.backup_dir, "backups.lock"))
+
+    # ---------- object store ----------
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _put(self, data, stats):
+        """Stores one piece unless it is already present. Returns its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            stats["reused"] += 1
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = zlib.compress(data, COMPRESSION_LEVEL)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(packed)
+        os.replace(temp_path, path)
+        stats["stored"] += 1
+        stats["bytes_written"] += len(packed)
+        return digest
+
+    def _get(self, digest):
+        with open(self._object_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Backup object {digest[:12]} is damaged.")
+        return data
+
+    def _store_file(self, filename, data, stats):
+        """Splits one file's contents into pieces and returns its manifest entry."""
+        entry = {"name": os.path.basename(filename), "size": len(data)}
+        stats["bytes_read"] += len(data)
+        if filename.lower().endswith(".xlsx") and zipfile.is_zipfile(io.BytesIO(data)):
+            entry["kind"] = "xlsx"
+            entry["parts"] = []
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for info in zf.infolist():
+                    entry["parts"].append({
+                        "name": info.filename,
+                        "hash": self._put(zf.read(info), stats),
+                        "compress_type": info.compress_type,
+                        "date_time": list(info.date_time),
+                    })
+        else:
+            entry["kind"] = "chunks"
+            entry["chunks"] = [self._put(data[i:i + CHUNK_SIZE], stats)
+                               for i in range(0, len(data), CHUNK_SIZE)]
+        return entry
+
+    def _rebuild(self, entry):
+        """Returns the contents of the file a manifest entry describes."""
+        if entry["kind"] == "xlsx":
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w") as zf:
+                for part in entry["parts"]:
+                    info = zipfile.ZipInfo(part["name"], tuple(part["date_time"]))
+                    info.compress_type = part["compress_type"]
+                    zf.writestr(info, self._get(part["hash"]))
+            return buffer.getvalue()
+        return b"".join(self._get(digest) for digest in entry["chunks"])
+
+    @staticmethod
+    def _write_file(target, data):
+        """Replaces target with data in one step."""
+        temp_path = target + ".restore"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, target)
+
+    def _restore_files(self, contents):
+        """Puts restored files ({file name: contents}) back in place. Returns the data files restored.
+
+        Files the storage engine owns go through storage.restore_data();
+        the rest (users.xlsx, or everything when no engine is attached)
+        are replaced on disk.
+        """
+        handled = self.storage.restore_data(contents) if self.storage is not None else []
+        restored = []
+        for filename in self.files_to_backup:
+            if filename in contents:
+                if filename not in handled:
+                    self._write_file(filename, contents[filename])
+                restored.append(filename)
+        if self.storage is not None:
+            return restored
+
+        # A journal left over from current data must not be replayed onto the restored file
+        if self.journal_file in contents:
+            self._write_file(self.journal_file, contents[self.journal_file])
+        elif "library.xlsx" in contents and os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        # A newer sequence file is kept otherwise: it only makes IDs skip ahead
+        if self.sequence_file in contents:
+            self._write_file(self.sequence_file, contents[self.sequence_file])
+        return restored
+
+    @staticmethod
+    def _hashes(entry):
+        if entry["kind"] == "xlsx":
+            return [part["hash"] for part in entry["parts"]]
+        return entry["chunks"]
+
+    # ---------- snapshots ----------
+
+    @staticmethod
+    def _snapshot_name(moment):
+        return f"snapshot_{moment.strftime(TIMESTAMP_FORMAT)}-{moment.microsecond // 1000:03d}"
+
+    def _capture(self):
+        """Returns {file name: contents or None} for everything a snapshot holds.
+
+        Files the storage engine owns come from one snapshot_data()
+        call; anything else is read from disk.
+        """
+        captured = self.storage.snapshot_data() if self.storage is not None else {}
+        # Un-checkpointed changes live in the journal, so it travels with the xlsx
+        for filename in self.files_to_backup + [self.journal_file, self.sequence_file]:
+            if filename in captured:
+                continue
+            try:
+                with open(filename, "rb") as f:
+                    captured[filename] = f.read()
+            except FileNotFoundError:
+                captured[filename] = None
+        return captured
+
+    def create_snapshot(self):
+        """Backs up the data files as a new snapshot.
+
+        Returns (snapshot name, stats) where stats counts the files
+        saved, bytes read, pieces newly stored and already present, and
+        compressed bytes written. The name is None when no data file
+        was found.
+        """
         self.ensure_backup_dir()
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        current_backup_path = os.path.join(self.backup_dir, f"backup_{timestamp}")
-        
-        try:
-            os.makedirs(current_backup_path)
-            files_backed_up = 0
+        now = datetime.datetime.now()
+        name = self._snapshot_name(now)
+        stats = {"files": 0, "bytes_read": 0, "stored": 0, "reused": 0, "bytes_written": 0, "missing": []}
+
+        captured = self._capture()
+        manifest = {"created": now.isoformat(timespec="seconds"), "files": []}
+        with self._lock():
             for filename in self.files_to_backup:
-                if os.path.exists(filename):
-                    shutil.copy2(filename, current_backup_path)
-                    files_backed_up += 1
+                if captured.get(filename) is not None:
+                    manifest["files"].append(self._store_file(filename, captured[filename], stats))
+                    stats["files"] += 1
                 else:
-                    print(f"WARNING {filename} not found, skipping.")
-            
-            if files_backed_up > 0:
-                print(f"\nSUCCESS Backup created at: {current_backup_path}")
-            else:
-                print("\nERROR No files were found to backup.")
+                    stats["missing"].append(filename)
+            if not stats["files"]:
+                return None, stats
+            for sidecar in (self.journal_file, self.sequence_file):
+                if sidecar not in self.files_to_backup and captured.get(sidecar) is not None:
+                    manifest["files"].append(self._store_file(sidecar, captured[sidecar], stats))
+
+            # Names must sort in creation order, even for two backups in one second
+            path = os.path.join(self.snapshots_dir, name + ".json")
+            while os.path.exists(path):
+                now += datetime.timedelta(milliseconds=1)
+                name = self._snapshot_name(now)
+                path = os.path.join(self.snapshots_dir, name + ".json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1)
+            os.replace(path + ".tmp", path)
+        return name, stats
+
+    def load_manifest(self, name):
+        with open(os.path.join(self.snapshots_dir, name + ".json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_snapshots(self):
+        """Returns the names of all snapshots, newest first."""
+        self.ensure_backup_dir()
+        names = [f[:-5] for f in os.listdir(self.snapshots_dir) if f.endswith(".json")]
+        names.sort(reverse=True)
+        return names
+
+    def restore_snapshot(self, name):
+        """Rebuilds every file of a snapshot in place. Returns the restored names."""
+        manifest = self.load_manifest(name)
+        entries = {entry["name"]: entry for entry in manifest["files"]}
+        contents = {}
+        for filename in self.files_to_backup + [self.journal_file, self.sequence_file]:
+            if os.path.basename(filename) in entries:
+                contents[filename] = self._rebuild(entries[os.path.basename(filename)])
+        return self._restore_files(contents)
+
+    # ---------- retention ----------
+
+    def apply_retention(self, now=None):
+        """Drops snapshots outside the retention policy and unreferenced pieces.
+
+        Returns (snapshots removed, pieces removed, bytes freed).
+        """
+        now = now or datetime.datetime.now()
+        with self._lock():
+            snapshots = []
+            for name in self.list_snapshots():
+                created = datetime.datetime.fromisoformat(self.load_manifest(name)["created"])
+                snapshots.append((created, name))
+            snapshots.sort(reverse=True)
+
+            keep = {name for created, name in snapshots[:1]}
+            policies = (
+                (KEEP_HOURLY, lambda t: t.strftime("%Y-%m-%d %H"), datetime.timedelta(hours=KEEP_HOURLY)),
+                (KEEP_DAILY, lambda t: t.date(), datetime.timedelta(days=KEEP_DAILY)),
+                (KEEP_WEEKLY, lambda t: tuple(t.isocalendar())[:2], datetime.timedelta(weeks=KEEP_WEEKLY)),
+            )
+            for count, bucket_of, window in policies:
+                buckets = set()
+                for created, name in snapshots:
+                    if len(buckets) >= count or created < now - window:
+                        break
+                    bucket = bucket_of(created)
+                    if bucket not in buckets:
+                        buckets.add(bucket)
+                        keep.add(name)
+
+            removed = 0
+            for created, name in snapshots:
+                if name not in keep:
+                    os.remove(os.path.join(self.snapshots_dir, name + ".json"))
+                    removed += 1
+            pieces, freed = self._collect_garbage()
+        return removed, pieces, freed
+
+    def _collect_garbage(self):
+        """Deletes stored pieces that no manifest refers to. Caller holds the lock."""
+        referenced = set()
+        for name in self.list_snapshots():
+            for entry in self.load_manifest(name)["files"]:
+                referenced.update(self._hashes(entry))
+
+        pieces = freed = 0
+        for prefix in os.listdir(self.objects_dir):
+            folder = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for digest in os.listdir(folder):
+                if digest not in referenced:
+                    path = os.path.join(folder, digest)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    pieces += 1
+        return pieces, freed
+
+    # ---------- menu actions ----------
+
+    def start_scheduler(self, interval=BACKUP_INTERVAL):
+        """Starts scheduled backups on a background thread (unless interval is 0)."""
+        if interval and self.scheduler is None:
+            self.scheduler = BackupScheduler(self, interval)
+            self.scheduler.start()
+        return self.scheduler
+
+    def stop_scheduler(self):
+        """Stops scheduled backups, letting a backup in progress finish."""
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+
+    def log_result(self, result):
+        """Appends the outcome of one backup run to backups/backup.log."""
+        self.ensure_backup_dir()
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+    def backup_data(self):
+        """Creates a backup snapshot of the data files.
+
+        With the scheduler running, the backup is handed to its thread
+        so the desk can carry on; its outcome shows under the schedule
+        status.
+        """
+        if self.scheduler is not None:
+            self.scheduler.trigger()
+            print("\n[INFO] Backup started in the background. See 'Backup Schedule Status' for the result.")
+            return
+        try:
+            name, stats = self.create_snapshot()
         except Exception as e:
             print(f"\nERROR Failed to create backup: {e}")
+            return
+        for filename in stats["missing"]:
+            print(f"WARNING {filename} not found, skipping.")
+        if name is None:
+            print("\nERROR No files were found to backup.")
+            return
+        print(f"\nSUCCESS Backup created: {name}")
+        print(f"New pieces: {stats['stored']} ({stats['bytes_written']} bytes compressed) | "
+              f"Unchanged pieces reused: {stats['reused']}")
 
-    def list_backups(self):
-        """Returns a list of available backup folders, sorted newest first."""
+    def show_schedule_status(self):
+        """Prints the backup interval and the outcome of the last scheduled run."""
+        if self.scheduler is None:
+            print("\n[INFO] Scheduled backups are off.")
+            return
+        print(f"\nScheduled backups every {self.scheduler.interval} seconds.")
+        result = self.scheduler.last_result
+        if self.scheduler.busy:
+            print("[INFO] A backup is running now.")
+        if result is None:
+            print("[INFO] No scheduled backup has run yet.")
+        elif "error" in result:
+            print(f"[ERROR] Last backup at {result['started']} failed: {result['error']}")
+        else:
+            print(f"Last backup: {result['name']} at {result['started']}")
+            print(f"Took {result['seconds']:.2f}s | Read {result['bytes_read']} bytes | "
+                  f"Wrote {result['bytes_written']} bytes ({result['stored']} new piece(s))")
+
+    def list_legacy_backups(self):
+        """Returns the backup_<timestamp> folders made by older versions."""
         self.ensure_backup_dir()
-        backups = [d for d in os.listdir(self.backup_dir) if os.path.isdir(os.path.join(self.backup_dir, d))]
-        backups.sort(reverse=True)
+        return [d for d in os.listdir(self.backup_dir)
+                if d.startswith("backup_") and os.path.isdir(os.path.join(self.backup_dir, d))]
+
+    def list_backups(self):
+        """Returns all snapshots and legacy backup folders, sorted newest first."""
+        backups = self.list_snapshots() + self.list_legacy_backups()
+        # Both kinds are named <kind>_<timestamp>
+        backups.sort(key=lambda name: name.split("_", 1)[1], reverse=True)
         return backups
 
+    def _restore_legacy(self, source_path):
+        contents = {}
+        for filename in self.files_to_backup + [self.journal_file, self.sequence_file]:
+            source_file = os.path.join(source_path, filename)
+            if os.path.exists(source_file):
+                with open(source_file, "rb") as f:
+                    contents[filename] = f.read()
+        return self._restore_files(contents)
+
     def restore_data(self):
         """Restores data files from a selected backup."""
         backups = self.list_backups()
@@ -51,9 +425,9 @@ class BackupManager:
             return
 
         print("\nAvailable Backups:")
-        for idx, folder_name in enumerate(backups):
-            print(f"{idx + 1}. {folder_name}")
-        
+        for idx, name in enumerate(backups):
+            print(f"{idx + 1}. {name}")
+
         choice = input("\nEnter backup number to restore (or 'c' to cancel): ")
         if choice.lower() == 'c':
             return
@@ -62,23 +436,21 @@ class BackupManager:
             idx = int(choice) - 1
             if 0 <= idx < len(backups):
                 selected_backup = backups[idx]
-                source_path = os.path.join(self.backup_dir, selected_backup)
-                
+
                 confirm = input(f"Are you sure you want to restore from '{selected_backup}'? \nThis will OVERWRITE current data. (y/n): ")
                 if confirm.lower() != 'y':
                     print("[INFO] Restore cancelled.")
                     return
 
                 print("Restoring...")
-                restored_count = 0
-                for filename in self.files_to_backup:
-                    source_file = os.path.join(source_path, filename)
-                    if os.path.exists(source_file):
-                        shutil.copy2(source_file, ".")
-                        print(f" - Restored {filename}")
-                        restored_count += 1
-                
-                if restored_count > 0:
+                if selected_backup.startswith("snapshot_"):
+                    restored = self.restore_snapshot(selected_backup)
+                else:
+                    restored = self._restore_legacy(os.path.join(self.backup_dir, selected_backup))
+                for filename in restored:
+                    print(f" - Restored {filename}")
+
+                if restored:
                     print("\n[SUCCESS] Restore complete.")
                 else:
                     print("\n[WARNING] No valid data files found in this backup.")
@@ -89,6 +461,19 @@ class BackupManager:
         except Exception as e:
             print(f"\n[ERROR] Restore failed: {e}")
 
+    def prune_backups(self):
+        """Applies the retention policy and reports what was freed."""
+        try:
+            removed, pieces, freed = self.apply_retention()
+        except Exception as e:
+            print(f"\n[ERROR] Clean-up failed: {e}")
+            return
+        if not removed and not pieces:
+            print("\n[INFO] All snapshots are within the retention policy.")
+            return
+        print(f"\n[SUCCESS] Removed {removed} snapshot(s) and {pieces} unused piece(s), "
+              f"freed {freed} bytes.")
+
     def backup_menu(self):
         """Displays the backup sub-menu."""
         while True:
@@ -96,8 +481,10 @@ class BackupManager:
             print("1. Create Backup")
             print("2. Restore Data")
             print("3. List Backups")
-            print("4. Back to Main Menu")
-            
+            print("4. Clean Up Old Backups")
+            print("5. Backup Schedule Status")
+            print("6. Back to Main Menu")
+
             choice = input("Enter choice: ")
             if choice == "1":
                 self.backup_data()
@@ -112,6 +499,79 @@ class BackupManager:
                 else:
                     print("\n[INFO] No backups found.")
             elif choice == "4":
+                self.prune_backups()
+            elif choice == "5":
+                self.show_schedule_status()
+            elif choice == "6":
                 break
             else:
                 print("[ERROR] Invalid choice.")
+
+
+class BackupScheduler:
+    """Takes a backup snapshot every `interval` seconds on a daemon thread.
+
+    Each run captures the data with BackupManager.create_snapshot,
+    applies the retention policy, and records duration and bytes
+    written in last_result and backups/backup.log. Failures are
+    recorded too; they never stop the thread.
+    """
+
+    def __init__(self, manager, interval=BACKUP_INTERVAL, prune=PRUNE_AFTER_BACKUP):
+        self.manager = manager
+        self.interval = interval
+        self.prune = prune
+        self.last_result = None
+        self.busy = False
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self):
+        """Runs a backup now instead of at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            self.run_once()
+
+    def run_once(self):
+        """Takes one snapshot and returns the result dict."""
+        self.busy = True
+        started = time.perf_counter()
+        result = {"started": datetime.datetime.now().isoformat(timespec="seconds")}
+        try:
+            name, stats = self.manager.create_snapshot()
+            result["name"] = name
+            result.update(stats)
+            if name is None:
+                result["error"] = "no data files found"
+            elif self.prune:
+                removed, pieces, freed = self.manager.apply_retention()
+                result.update(pruned_snapshots=removed, pruned_pieces=pieces, bytes_freed=freed)
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.last_result = result
+        self.busy = False
+        try:
+            self.manager.log_result(result)
+        except OSError:
+            pass
+        return result
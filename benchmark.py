@@ -0,0 +1,393 @@
+# benchmark.py
+# ------------------------------------------------------------
+# Synthetic-data benchmark for the manager operations.
+#
+# Builds a library of the requested size in a scratch directory,
+# then drives the same menu actions a librarian uses (issue/return a
+# book, view/search books, the reports, ...) without a keyboard:
+# their input() prompts are answered from a script and their output
+# is discarded. Every call is timed, as is the time main.py takes to
+# show its first prompt on that library, and the run is saved as JSON
+# with latency percentiles and peak RSS, so runs can be compared
+# across commits and storage backends.
+#
+# Usage:
+#   python benchmark.py [--backend excel|sqlite] [--books N] [--members N]
+#                       [--transactions N] [--repeat N] [--seed N]
+#                       [--output FILE] [--dir DIR]
+#   python benchmark.py compare OLD.json NEW.json
+#
+# For example, a large library:
+#   python benchmark.py --books 100000 --members 50000 --transactions 2000000
+# ------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import builtins
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+
+from models import DATE_FORMAT, TransactionTable
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+# -------- CONFIGURATION --------
+DEFAULT_BOOKS = 2000
+DEFAULT_MEMBERS = 1000
+DEFAULT_TRANSACTIONS = 20000
+
+# Timed calls per operation
+DEFAULT_REPEAT = 20
+
+# Share of generated transactions that are still open (book not returned)
+OPEN_SHARE = 0.05
+
+# Generated loans are spread over this many days before today
+HISTORY_DAYS = 365
+
+RESULTS_DIR = "benchmarks"
+# -------------------------------
+
+WORDS = ("river", "shadow", "garden", "empire", "silent", "winter", "machine", "ocean",
+         "secret", "golden", "forest", "night", "glass", "history", "storm", "letters",
+         "kingdom", "paper", "stone", "journey", "python", "data", "city", "light")
+FIRST_BOOK_ID = 101
+FIRST_MEMBER_ID = 1001
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def percentile(sorted_values, share):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(share * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or None outside a git tree."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -------- DATA GENERATION --------
+def generate_rows(books, members, transactions, seed):
+    """Returns (book rows, member rows, transaction rows) of a consistent library.
+
+    Open loans are reflected in Books.Issued (and taken out of
+    Quantity) and in Members.BooksIssued, as the managers would have
+    left them.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    book_ids = range(FIRST_BOOK_ID, FIRST_BOOK_ID + books)
+    member_ids = range(FIRST_MEMBER_ID, FIRST_MEMBER_ID + members)
+
+    issued = dict.fromkeys(book_ids, 0)
+    borrowed = dict.fromkeys(member_ids, 0)
+    transaction_rows = []
+    for trans_id in range(1, transactions + 1):
+        book_id = rng.choice(book_ids)
+        member_id = rng.choice(member_ids)
+        issue_date = today - timedelta(days=rng.randrange(HISTORY_DAYS))
+        if rng.random() < OPEN_SHARE:
+            return_date, fine = "", 0
+            issued[book_id] += 1
+            borrowed[member_id] += 1
+        else:
+            kept = rng.randint(1, 20)
+            returned = min(issue_date + timedelta(days=kept), today)
+            fine = max((returned - issue_date).days - 7, 0) * 10
+            return_date = returned.strftime(DATE_FORMAT)
+        # Member and Book IDs in transactions are stored as typed at the prompt
+        transaction_rows.append([trans_id, str(member_id), str(book_id),
+                                 issue_date.strftime(DATE_FORMAT), return_date, fine])
+
+    book_rows = [[book_id, " ".join(rng.sample(WORDS, 3)).title(), f"Author {rng.randrange(books // 4 + 1)}",
+                  rng.randint(1, 10), issued[book_id]] for book_id in book_ids]
+    member_rows = [[member_id, f"Member {member_id}", f"9{rng.randrange(10 ** 9):09d}", borrowed[member_id]]
+                   for member_id in member_ids]
+    return book_rows, member_rows, transaction_rows
+
+
+def write_library(backend, book_rows, member_rows, transaction_rows):
+    """Writes the generated rows as library.xlsx or library.db in the current directory."""
+    from storage import REQUIRED_SHEETS, LIBRARY_FILE, SQLITE_FILE
+
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+
+        storage = SQLiteStorage(SQLITE_FILE)
+        for sheet_name, rows in (("Books", book_rows), ("Members", member_rows),
+                                 ("Transactions", transaction_rows)):
+            storage.add_rows(sheet_name, rows)
+        storage.conn.commit()
+        storage.conn.close()
+        return [SQLITE_FILE]
+
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows straight to the file
+    wb = Workbook(write_only=True)
+    for sheet_name, rows in (("Books", book_rows), ("Members", member_rows),
+                             ("Transactions", transaction_rows)):
+        ws = wb.create_sheet(sheet_name)
+        ws.append(REQUIRED_SHEETS[sheet_name])
+        for row in rows:
+            ws.append(row)
+    wb.save(LIBRARY_FILE)
+    return [LIBRARY_FILE]
+
+
+# -------- DRIVING THE MENUS --------
+@contextmanager
+def scripted(answers):
+    """Answers input() prompts from answers and swallows everything printed."""
+    replies = iter(answers)
+    real_input = builtins.input
+    builtins.input = lambda prompt="": next(replies)
+    try:
+        with redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = real_input
+
+
+class Benchmark:
+    def __init__(self, backend, repeat=DEFAULT_REPEAT, seed=0):
+        self.backend = backend
+        self.repeat = repeat
+        self.rng = random.Random(seed + 1)
+        self.results = {}
+
+    def open(self, book_rows, member_rows):
+        from storage import create_storage
+        from books import BookManager
+        from members import MemberManager
+        from transactions import TransactionManager
+        from reports import ReportGenerator
+
+        self.storage = create_storage(self.backend)
+        self.books = BookManager(self.storage)
+        self.members = MemberManager(self.storage)
+        self.transactions = TransactionManager(self.storage)
+        self.reports = ReportGenerator(self.storage)
+        self.in_stock = [str(row[0]) for row in book_rows if row[3] > 0]
+        self.member_ids = [str(row[0]) for row in member_rows]
+        self.titles = [row[1] for row in book_rows]
+
+    def time(self, name, action, answers=lambda: []):
+        """Calls action self.repeat times, each with fresh scripted answers."""
+        latencies = []
+        for _ in range(self.repeat):
+            with scripted(answers()):
+                started = time.perf_counter()
+                action()
+                latencies.append((time.perf_counter() - started) * 1000)
+        ordered = sorted(latencies)
+        self.results[name] = {
+            "count": len(latencies),
+            "first_ms": round(latencies[0], 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(percentile(ordered, 0.50), 3),
+            "p90_ms": round(percentile(ordered, 0.90), 3),
+            "p99_ms": round(percentile(ordered, 0.99), 3),
+            "max_ms": round(ordered[-1], 3),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        print(f"{name:<22} p50 {self.results[name]['p50_ms']:>9.2f} ms | "
+              f"p99 {self.results[name]['p99_ms']:>9.2f} ms | first {self.results[name]['first_ms']:>9.2f} ms")
+
+    def run(self):
+        loans = []
+
+        def issue_answers():
+            pair = (self.rng.choice(self.member_ids), self.rng.choice(self.in_stock))
+            loans.append(pair)
+            return list(pair)
+
+        def search_answers():
+            words = self.rng.choice(self.titles).split()
+            return [self.rng.choice(words)[:4].lower()]
+
+        self.time("issue_book", self.transactions.issue_book, issue_answers)
+        self.time("return_book", self.transactions.return_book, lambda: list(loans.pop()))
+        self.time("view_books", self.books.view_books)
+        self.time("search_book", self.books.search_book, search_answers)
+        self.time("view_members", self.members.view_members)
+        self.time("search_member", self.members.search_member, lambda: [self.rng.choice(self.member_ids)])
+        self.time("view_active_issues", self.reports.view_active_issues)
+        self.time("view_overdue_books", self.reports.view_overdue_books)
+        self.time("view_due_soon", self.reports.view_due_soon, lambda: ["3"])
+        self.time("view_total_fine", self.reports.view_total_fine)
+        self.time("view_fine_summary", self.reports.view_fine_summary)
+        self.time("load_transaction_table", lambda: TransactionTable.load(self.storage))
+        self.storage.close()
+        return self.results
+
+
+def measure_startup(backend):
+    """Runs `main.py --startup-time` on the library in the current directory.
+
+    Returns (ms to the first prompt as main.py measures it, wall-clock
+    ms including interpreter start-up).
+    """
+    main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    env = dict(os.environ, LIBRARY_BACKEND=backend)
+    env.pop("LIBRARY_PROFILE", None)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, main_script, "--startup-time"], capture_output=True,
+                            text=True, env=env, check=True).stdout
+    wall = (time.perf_counter() - started) * 1000
+    first_prompt = float(output.strip().splitlines()[-1].split()[-2])
+    return round(first_prompt, 3), round(wall, 3)
+
+
+def data_size(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def run_benchmark(backend, books, members, transactions, repeat, seed, workdir):
+    """Generates a library in workdir, runs every operation and returns the result dict."""
+    report = {
+        "backend": backend,
+        "commit": git_commit(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {"books": books, "members": members, "transactions": transactions},
+        "repeat": repeat,
+        "seed": seed,
+    }
+    home = os.getcwd()
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        book_rows, member_rows, transaction_rows = generate_rows(books, members, transactions, seed)
+        files = write_library(backend, book_rows, member_rows, transaction_rows)
+        report["generate_seconds"] = round(time.perf_counter() - started, 3)
+        report["data_bytes"] = data_size(files)
+        del transaction_rows
+        print(f"[INFO] Generated {books} books, {members} members, {transactions} transactions "
+              f"in {report['generate_seconds']:.1f}s")
+
+        report["startup_ms"], report["startup_wall_ms"] = measure_startup(backend)
+        print(f"{'startup (first prompt)':<22} {report['startup_ms']:>13.2f} ms | "
+              f"wall {report['startup_wall_ms']:>8.2f} ms")
+
+        started = time.perf_counter()
+        bench = Benchmark(backend, repeat, seed)
+        bench.open(book_rows, member_rows)
+        bench.storage.get_row("Books", str(FIRST_BOOK_ID))   # loads the data
+        report["open_seconds"] = round(time.perf_counter() - started, 3)
+
+        report["transaction_table_bytes"] = TransactionTable.load(bench.storage).nbytes()
+        report["operations"] = bench.run()
+        report["peak_rss_kb"] = peak_rss_kb()
+    finally:
+        os.chdir(home)
+    return report
+
+
+def compare(old_file, new_file):
+    """Prints p50/p99 of two saved runs side by side."""
+    with open(old_file, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_file, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"OLD: {old.get('commit')} {old['backend']} {old['sizes']}")
+    print(f"NEW: {new.get('commit')} {new['backend']} {new['sizes']}")
+    print(f"{'operation':<22}{'old p50':>11}{'new p50':>11}{'old p99':>11}{'new p99':>11}{'p50 x':>8}")
+    for name, result in new["operations"].items():
+        before = old["operations"].get(name)
+        if before is None:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        print(f"{name:<22}{before['p50_ms']:>11.2f}{result['p50_ms']:>11.2f}"
+              f"{before['p99_ms']:>11.2f}{result['p99_ms']:>11.2f}{ratio:>8.2f}")
+    print(f"startup (ms): {old.get('startup_ms')} -> {new.get('startup_ms')}")
+    print(f"peak RSS (KiB): {old.get('peak_rss_kb')} -> {new.get('peak_rss_kb')}")
+
+
+def _option(args, name, default, kind=int):
+    if name in args:
+        return kind(args[args.index(name) + 1])
+    return default
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["compare"]:
+        if len(args) != 3:
+            print("Usage: python benchmark.py compare OLD.json NEW.json")
+            sys.exit(1)
+        compare(args[1], args[2])
+        sys.exit(0)
+
+    try:
+        backend = _option(args, "--backend", "excel", str)
+        books = _option(args, "--books", DEFAULT_BOOKS)
+        members = _option(args, "--members", DEFAULT_MEMBERS)
+        transactions = _option(args, "--transactions", DEFAULT_TRANSACTIONS)
+        repeat = _option(args, "--repeat", DEFAULT_REPEAT)
+        seed = _option(args, "--seed", 0)
+        output = _option(args, "--output", None, str)
+        workdir = _option(args, "--dir", None, str)
+    except (IndexError, ValueError):
+        print("Usage: python benchmark.py [--backend excel|sqlite] [--books N] [--members N] "
+              "[--transactions N] [--repeat N] [--seed N] [--output FILE] [--dir DIR]")
+        sys.exit(1)
+    if backend not in ("excel", "sqlite") or min(books, members, repeat) < 1 or transactions < 0:
+        print("[ERROR] Invalid benchmark options.")
+        sys.exit(1)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        output = os.path.join(RESULTS_DIR, f"benchmark_{backend}_{stamp}.json")
+    output = os.path.abspath(output)
+
+    # LIBRARY_PROFILE=summary breaks each operation down further
+    import instrumentation
+    instrumentation.install()
+
+    # The library is built in a scratch directory, never over real data
+    scratch = workdir is None
+    if scratch:
+        workdir = tempfile.mkdtemp(prefix="library_bench_")
+    else:
+        os.makedirs(workdir, exist_ok=True)
+        if any(os.path.exists(os.path.join(workdir, name)) for name in ("library.xlsx", "library.db")):
+            print(f"[ERROR] '{workdir}' already holds library data; pick an empty directory.")
+            sys.exit(1)
+    try:
+        report = run_benchmark(backend, books, members, transactions, repeat, seed, workdir)
+    finally:
+        if scratch:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[SUCCESS] Results saved to {output} (peak RSS {report['peak_rss_kb']} KiB)")
@@ -1,28 +1,70 @@
 # books.py
-from models import Book
+from models import Book, TransactionTable
+from storage import StaleWorkbookError
+from filelock import LockTimeout
+from indexes import CatalogIndex
+from importer import BulkImporter, print_import_report, prompt_import_path
 
 class BookManager:
     def __init__(self, storage):
         self.storage = storage
         self.sheet_name = "Books"
-
-    def generate_book_id(self, ws):
-        """Generates a simple incremental Book ID."""
-        last_row = ws.max_row
-        if last_row <= 1:
-            return 101  # Start from 101
-        last_id = ws.cell(row=last_row, column=1).value
-        # Handle cases where cell might be None or not an int (if corrupted)
-        try:
-            return int(last_id) + 1
-        except (TypeError, ValueError):
-            return 101
+        self.first_id = 101     # Book IDs start from 101
+        self.catalog = CatalogIndex()
+        self.catalog_generation = None
+
+    def get_catalog(self):
+        """Returns the title/author search index, rebuilding it if the data was reloaded."""
+        generation = self.storage.generation()
+        if generation != self.catalog_generation:
+            self.catalog.build(self.storage.get_rows(self.sheet_name))
+            self.catalog_generation = generation
+        return self.catalog
+
+    def generate_book_id(self):
+        """Allocates the next incremental Book ID."""
+        return self.storage.allocate_ids(self.sheet_name, start=self.first_id)
+
+    def create_book(self, title, author, quantity):
+        """Adds a book without saving and returns its Book ID."""
+        book = Book(self.generate_book_id(), title, author, quantity)
+        self.storage.add_row(self.sheet_name, [
+            book.book_id,
+            book.title,
+            book.author,
+            book.quantity,
+            book.issued
+        ])
+        self.get_catalog().add(book.book_id, book.title, book.author)
+        return book.book_id
+
+    def remove_book(self, book_id):
+        """Deletes a book without saving. Returns False if it does not exist."""
+        if not self.storage.delete_row(self.sheet_name, book_id):
+            return False
+        self.get_catalog().remove(book_id)
+        return True
+
+    def find_books(self, query):
+        """Returns book rows matching a Book ID, or Title/Author words, best match first."""
+        # An exact ID match comes first, then title/author matches by rank
+        matches = []
+        id_match = self.storage.get_row(self.sheet_name, query) if query else None
+        if id_match is not None:
+            matches.append(str(id_match[0]))
+        for book_id in self.get_catalog().search(query):
+            if book_id not in matches:
+                matches.append(book_id)
+
+        rows = []
+        for match_id in matches:
+            row = self.storage.get_row(self.sheet_name, match_id)
+            if row is not None:
+                rows.append(row)
+        return rows
 
     def add_book(self):
-        """Adds a new book to Excel."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
+        """Adds a new book to the library."""
         title = input("Enter Book Title: ")
         author = input("Enter Author Name: ")
         
@@ -33,48 +75,27 @@ class BookManager:
             except ValueError:
                 print("Invalid input. Please enter a number for Quantity.")
 
-        book_id = self.generate_book_id(ws)
-        book = Book(book_id, title, author, quantity)
-
-        ws.append([
-            book.book_id,
-            book.title,
-            book.author,
-            book.quantity
-        ])
-
-        self.storage.save_workbook(wb)
+        try:
+            book_id = self.storage.run_with_retry(lambda: self.create_book(title, author, quantity))
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
         print(f"\n Book added successfully.")
-        print(f"Book ID: {book.book_id}\n")
+        print(f"Book ID: {book_id}\n")
 
     def view_books(self):
         """Displays all books with Available, Issued, and Total counts."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-        
-        # Calculate Issued Counts from Transactions
-        issued_counts = {}
-        if "Transactions" in wb.sheetnames:
-            ws_trans = wb["Transactions"]
-            for row in ws_trans.iter_rows(min_row=2, values_only=True):
-                # Row: TransactionID, MemberID, BookID, IssueDate, ReturnDate, Fine
-                if len(row) >= 5:
-                    book_id = str(row[2])
-                    return_date = row[4]
-                    if return_date is None or return_date == "":
-                        issued_counts[book_id] = issued_counts.get(book_id, 0) + 1
-
         print("\n LIBRARY BOOKS \n")
-        if ws.max_row <= 1:
-            print("No books found.\n")
-            return
-
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue # Skip empty rows
-            book_id, title, author, quantity = row
+        found = False
+        for row in self.storage.get_rows(self.sheet_name):
+            book_id, title, author, quantity, issued = row
+            found = True
             
-            available_qty = quantity
-            issued_qty = issued_counts.get(str(book_id), 0)
+            available_qty = quantity or 0
+            issued_qty = issued or 0
             total_qty = available_qty + issued_qty
             
             print(
@@ -83,57 +104,94 @@ class BookManager:
                 f"Author: {author} | "
                 f"Available: {available_qty} | Issued: {issued_qty} | Total: {total_qty}"
             )
+        if not found:
+            print("No books found.")
         print()
 
     def search_book(self):
-        """Searches for a book by BookID or Title."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
-        search_query = input("Enter Book ID or Title to search: ").lower()
+        """Searches for a book by BookID, or by words (or word prefixes) of its Title and Author."""
+        search_query = input("Enter Book ID, Title or Author to search: ").strip()
         found = False
 
         print("\nSearch Results:")
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            book_id, title, author, quantity = row
-            if str(book_id) == search_query or search_query in str(title).lower():
-                print(f"ID: {book_id} | Title: {title} | Author: {author} | Qty: {quantity}")
-                found = True
+        for row in self.find_books(search_query):
+            book_id, title, author, quantity = row[:4]
+            print(f"ID: {book_id} | Title: {title} | Author: {author} | Qty: {quantity}")
+            found = True
 
         if not found:
             print("No matching book found.")
         print()
 
     def delete_book(self):
-        """Deletes a book from Excel by BookID."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
+        """Deletes a book by BookID."""
         delete_id = input("Enter Book ID to delete: ")
-        found = False
-        rows_to_keep = []
 
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            book_id = str(row[0])
-            if book_id != delete_id:
-                rows_to_keep.append(row)
-            else:
-                found = True
+        try:
+            deleted = self.storage.run_with_retry(lambda: self.remove_book(delete_id))
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
 
-        if not found:
+        if not deleted:
             print("\n Book not found.\n")
             return
 
-        # Clear existing data (except header)
-        ws.delete_rows(2, ws.max_row)
-        for row in rows_to_keep:
-            ws.append(list(row))
-
-        self.storage.save_workbook(wb)
         print("\nBook deleted successfully.\n")
 
+    def rebuild_issued_counts(self):
+        """Recomputes every book's Issued counter from the open transactions."""
+        try:
+            corrected = self.storage.run_with_retry(self._correct_issued_counts)
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
+        if not corrected:
+            print("\n[INFO] Issued counts are already correct.\n")
+            return
+
+        for book_id, stored, actual in corrected:
+            print(f"Book {book_id}: Issued {stored} -> {actual}")
+        print(f"\n[SUCCESS] Corrected {len(corrected)} book(s).\n")
+
+    def _correct_issued_counts(self):
+        """Fixes Issued counters without saving. Returns (book, stored, actual) per change."""
+        issued_counts = TransactionTable.load(self.storage).open_counts("book_ids")
+
+        corrected = []
+        for row in self.storage.get_rows(self.sheet_name):
+            book_id, stored = row[0], row[4] or 0
+            actual = issued_counts.get(str(book_id), 0)
+            if stored != actual:
+                corrected.append((book_id, stored, actual))
+
+        for book_id, stored, actual in corrected:
+            self.storage.update_row(self.sheet_name, book_id, {"Issued": actual})
+        return corrected
+
+    def bulk_import_books(self):
+        """Imports many books at once from a CSV or .xlsx file (Title, Author, Quantity)."""
+        path = prompt_import_path()
+        if path is None:
+            return
+        try:
+            result = BulkImporter(self.storage).import_books(path, self.first_id)
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!\n")
+            return
+        except Exception as e:
+            print(f"\n[ERROR] Import failed, nothing was saved: {e}\n")
+            return
+        # Rebuild the search index on the next search
+        self.catalog_generation = None
+        print_import_report(result)
+
     def books_menu(self):
         """Displays the Books menu and routes user choices."""
         while True:
@@ -142,7 +200,9 @@ class BookManager:
             print("2. View Books")
             print("3. Search Book")
             print("4. Delete Book")
-            print("5. Back to Main Menu")
+            print("5. Rebuild Issued Counts")
+            print("6. Bulk Import Books")
+            print("7. Back to Main Menu")
 
             choice = input("Enter choice: ")
             if choice == "1":
@@ -154,6 +214,10 @@ class BookManager:
             elif choice == "4":
                 self.delete_book()
             elif choice == "5":
+                self.rebuild_issued_counts()
+            elif choice == "6":
+                self.bulk_import_books()
+            elif choice == "7":
                 break
             else:
                 print("\n Invalid choice. Try again.\n")
\ No newline at end of file
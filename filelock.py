@@ -0,0 +1,88 @@
+# filelock.py
+# ------------------------------------------------------------
+# Cross-process advisory lock on a small lock file.
+#
+# Used where two copies of the app (or the app and a nightly job)
+# may touch the same library files at once. The lock is held on a
+# separate "<name>.lock" file so the protected file itself can be
+# replaced atomically while the lock is held.
+#
+# Usage:
+#   with FileLock("library.xlsx.seq.lock"):
+#       ...
+# ------------------------------------------------------------
+
+import time
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+# -------- CONFIGURATION --------
+# Seconds to wait for another process before giving up
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+# -------------------------------
+
+
+class LockTimeout(Exception):
+    """Raised when a lock is still held by another process after the timeout."""
+
+
+class FileLock:
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.handle = None
+        self.depth = 0
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        """Blocks until the lock is held. Re-entrant within one FileLock."""
+        if self.depth:
+            self.depth += 1
+            return
+        self.handle = open(self.path, "a+")
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock():
+            if time.monotonic() >= deadline:
+                self.handle.close()
+                self.handle = None
+                raise LockTimeout(f"'{self.path}' is locked by another process.")
+            time.sleep(LOCK_POLL_INTERVAL)
+        self.depth = 1
+
+    def release(self):
+        if not self.depth:
+            return
+        self.depth -= 1
+        if self.depth:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
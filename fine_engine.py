@@ -0,0 +1,177 @@
+# fine_engine.py
+# ------------------------------------------------------------
+# Batched fine and overdue computation over the whole ledger.
+#
+# The ledger is loaded once into a models.TransactionTable, whose
+# IssueDate/ReturnDate columns are integer day ordinals, and late days
+# and fines for every transaction are computed over those columns in a
+# single pass with NumPy (or stdlib array.array when NumPy is not
+# installed; NumPy is only imported the first time the engine runs).
+#
+# Used to re-price stored fines after fine_per_day/due_days change
+# (meant to run nightly) and for whole-ledger fine/overdue summaries:
+#   python fine_engine.py [--fine-per-day N] [--due-days N] [--dry-run]
+#
+# The fine rule is the same as TransactionManager.calculate_fine:
+#   fine = max(days kept - due_days, 0) * fine_per_day
+# Rows with an unreadable IssueDate are never fined.
+# ------------------------------------------------------------
+
+import sys
+from array import array
+from datetime import date
+
+from models import DATE_FORMAT, NO_DATE, TransactionTable
+
+# -------- CONFIGURATION --------
+FINE_PER_DAY = 10
+DUE_DAYS = 7
+# -------------------------------
+
+
+# NumPy is imported on first use, not at startup; None once it is found missing
+_np = False
+
+
+def _numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+
+class FineEngine:
+    def __init__(self, fine_per_day=FINE_PER_DAY, due_days=DUE_DAYS):
+        self.fine_per_day = fine_per_day
+        self.due_days = due_days
+
+    def late_days(self, ledger, today=None):
+        """Returns days past due for every row.
+
+        Returned loans count up to their ReturnDate, open loans up to
+        today. Rows with no readable IssueDate are 0.
+        """
+        today = (today or date.today()).toordinal()
+        np = _numpy()
+        if np is not None:
+            issued = np.array(ledger.issued, dtype=np.int64)
+            returned = np.array(ledger.returned, dtype=np.int64)
+            end = np.where(returned == NO_DATE, today, returned)
+            late = np.maximum(end - issued - self.due_days, 0)
+            late[issued == NO_DATE] = 0
+            return late
+        due = self.due_days
+        return array("l", [
+            0 if issue == NO_DATE else max((today if ret == NO_DATE else ret) - issue - due, 0)
+            for issue, ret in zip(ledger.issued, ledger.returned)
+        ])
+
+    def compute(self, ledger, today=None):
+        """Returns (late days, fines) for every row in one pass."""
+        late = self.late_days(ledger, today)
+        if _numpy() is not None:
+            return late, late * self.fine_per_day
+        rate = self.fine_per_day
+        return late, array("d", [days * rate for days in late])
+
+    def reprice(self, storage, today=None, commit=True):
+        """Recomputes the Fine of every returned loan with the current rules.
+
+        Only rows whose stored fine changes are written, all in one
+        commit, and the TotalFine report total is moved by the same
+        amount. Returns (rows changed, change in total fine).
+        """
+        from aggregates import ReportAggregates
+
+        aggregates = ReportAggregates(storage)
+        # Totals must exist before any fine is rewritten, or building
+        # them later would count the change twice.
+        aggregates.ensure()
+        ledger = TransactionTable.load(storage)
+        late, fines = self.compute(ledger, today)
+        np = _numpy()
+        if np is not None:
+            stored = np.array(ledger.fines, dtype=np.float64)
+            closed = np.array(ledger.returned, dtype=np.int64) != NO_DATE
+            changed = np.flatnonzero(closed & (fines != stored)).tolist()
+        else:
+            changed = [i for i, ret in enumerate(ledger.returned)
+                       if ret != NO_DATE and fines[i] != ledger.fines[i]]
+        if not changed:
+            return 0, 0
+
+        delta = 0
+        for i in changed:
+            fine = int(late[i]) * self.fine_per_day
+            delta += fine - ledger.fine(i)
+            storage.update_row("Transactions", ledger.key(i), {"Fine": fine})
+        aggregates.record_fine_change(delta)
+        if commit:
+            storage.commit()
+        return len(changed), delta
+
+    def summary(self, storage, today=None):
+        """Whole-ledger figures for the fine and overdue reports.
+
+        Returns a dict with the fines due on returned loans under the
+        current rules, the number of overdue open loans and their
+        estimated fines, and the largest number of days late.
+        """
+        ledger = TransactionTable.load(storage)
+        late, fines = self.compute(ledger, today)
+        np = _numpy()
+        if np is not None:
+            open_mask = np.array(ledger.returned, dtype=np.int64) == NO_DATE
+            overdue = open_mask & (late > 0)
+            return {
+                "transactions": len(ledger),
+                "returned_fines": int(fines[~open_mask].sum()),
+                "overdue_loans": int(overdue.sum()),
+                "overdue_fines": int(fines[overdue].sum()),
+                "max_days_late": int(late.max()) if len(ledger) else 0,
+            }
+        returned_fines = overdue_loans = overdue_fines = 0
+        for ret, days, fine in zip(ledger.returned, late, fines):
+            if ret != NO_DATE:
+                returned_fines += fine
+            elif days > 0:
+                overdue_loans += 1
+                overdue_fines += fine
+        return {
+            "transactions": len(ledger),
+            "returned_fines": int(returned_fines),
+            "overdue_loans": overdue_loans,
+            "overdue_fines": int(overdue_fines),
+            "max_days_late": max(late) if len(ledger) else 0,
+        }
+
+
+def _option(args, name, default):
+    if name in args:
+        return int(args[args.index(name) + 1])
+    return default
+
+
+if __name__ == "__main__":
+    from storage import create_storage
+
+    args = sys.argv[1:]
+    try:
+        engine = FineEngine(_option(args, "--fine-per-day", FINE_PER_DAY), _option(args, "--due-days", DUE_DAYS))
+    except (IndexError, ValueError):
+        print("Usage: python fine_engine.py [--fine-per-day N] [--due-days N] [--dry-run]")
+        sys.exit(1)
+
+    storage = create_storage()
+    print(f"Date: {date.today().strftime(DATE_FORMAT)} | Engine: {'numpy' if _numpy() is not None else 'array'}")
+    if "--dry-run" in args:
+        for name, value in engine.summary(storage).items():
+            print(f"{name}: {value}")
+    else:
+        changed, delta = engine.reprice(storage)
+        print(f"[SUCCESS] Re-priced {changed} transaction(s), total fine changed by Rs. {delta}")
+    storage.close()
@@ -0,0 +1,158 @@
+# importer.py
+# ------------------------------------------------------------
+# Bulk import of books and members from CSV or .xlsx files.
+#
+# Rows are streamed from the source, validated, given IDs reserved
+# from storage's ID sequences one block at a time, and written to
+# storage with a single commit at the end.
+#
+# Expected columns (header row, any order, case-insensitive):
+#   Books:   Title, Author, Quantity
+#   Members: Name, Phone
+# ------------------------------------------------------------
+
+import csv
+import os
+import time
+
+
+def read_source(path):
+    """Yields (line number, {lower-case header: value}) for each data row."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            headers = [str(h or "").strip().lower() for h in next(rows, [])]
+            for line_no, row in enumerate(rows, start=2):
+                if not any(v is not None and v != "" for v in row):
+                    continue
+                yield line_no, dict(zip(headers, row))
+        finally:
+            wb.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            headers = [h.strip().lower() for h in next(reader, [])]
+            for row in reader:
+                if not any(v.strip() for v in row):
+                    continue
+                yield reader.line_num, dict(zip(headers, row))
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def validate_book(record):
+    """Returns (title, author, quantity) or raises ValueError with a reason."""
+    title = _text(record.get("title"))
+    if not title:
+        raise ValueError("missing Title")
+    try:
+        number = float(_text(record.get("quantity")))
+        quantity = int(number)
+    except (ValueError, OverflowError):
+        raise ValueError(f"invalid Quantity {record.get('quantity')!r}")
+    if quantity != number:
+        raise ValueError(f"Quantity {record.get('quantity')!r} is not a whole number")
+    if quantity < 0:
+        raise ValueError("negative Quantity")
+    return title, _text(record.get("author")), quantity
+
+
+def validate_member(record):
+    """Returns (name, phone) or raises ValueError with a reason."""
+    name = _text(record.get("name"))
+    if not name:
+        raise ValueError("missing Name")
+    return name, _text(record.get("phone"))
+
+
+class BulkImporter:
+    # Rows handed to storage.add_rows at a time while streaming
+    BLOCK_SIZE = 1000
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _write_block(self, sheet_name, start, to_row, block):
+        """Reserves IDs for a block of validated rows and adds them. Returns the ID range."""
+        first = self.storage.allocate_ids(sheet_name, len(block), start)
+        self.storage.add_rows(sheet_name, [to_row(first + i, fields) for i, fields in enumerate(block)])
+        return first, first + len(block) - 1
+
+    def _import(self, path, sheet_name, start, validate, to_row):
+        started = time.perf_counter()
+        imported, rejected, block = 0, [], []
+        first_id = last_id = None
+
+        try:
+            for line_no, record in read_source(path):
+                try:
+                    block.append(validate(record))
+                except ValueError as e:
+                    rejected.append((line_no, str(e)))
+                    continue
+                if len(block) >= self.BLOCK_SIZE:
+                    first, last_id = self._write_block(sheet_name, start, to_row, block)
+                    first_id = first if first_id is None else first_id
+                    imported += len(block)
+                    block = []
+
+            if block:
+                first, last_id = self._write_block(sheet_name, start, to_row, block)
+                first_id = first if first_id is None else first_id
+                imported += len(block)
+            if imported:
+                self.storage.commit()
+        except Exception:
+            # Nothing from a failed import may reach the file
+            self.storage.rollback()
+            raise
+
+        elapsed = time.perf_counter() - started
+        return {
+            "imported": imported,
+            "rejected": rejected,
+            "first_id": first_id,
+            "last_id": last_id,
+            "seconds": elapsed,
+            "rows_per_second": (imported + len(rejected)) / elapsed if elapsed > 0 else 0,
+        }
+
+    def import_books(self, path, start=1):
+        """Imports books from a CSV/xlsx file; no ID below start is used."""
+        return self._import(path, "Books", start, validate_book,
+                            lambda book_id, f: [book_id, f[0], f[1], f[2], 0])
+
+    def import_members(self, path, start=1):
+        """Imports members from a CSV/xlsx file; no ID below start is used."""
+        return self._import(path, "Members", start, validate_member,
+                            lambda member_id, f: [member_id, f[0], f[1], 0])
+
+
+def print_import_report(result):
+    """Prints the outcome of a bulk import in the menus' usual style."""
+    if result["imported"]:
+        print(f"\n[SUCCESS] Imported {result['imported']} row(s), "
+              f"IDs {result['first_id']} - {result['last_id']}.")
+    else:
+        print("\n[INFO] No rows were imported.")
+    if result["rejected"]:
+        print(f"[WARNING] Rejected {len(result['rejected'])} row(s):")
+        for line_no, reason in result["rejected"][:20]:
+            print(f" - line {line_no}: {reason}")
+        if len(result["rejected"]) > 20:
+            print(f" - ... and {len(result['rejected']) - 20} more")
+    print(f"Took {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)\n")
+
+
+def prompt_import_path():
+    """Asks for a source file; returns None if it does not exist."""
+    path = input("Enter path of CSV or .xlsx file to import: ").strip().strip('"')
+    if not os.path.exists(path):
+        print(f"\n[ERROR] File '{path}' not found.\n")
+        return None
+    return path
@@ -0,0 +1,318 @@
+# indexes.py
+# ------------------------------------------------------------
+# In-memory indexes over the library data.
+#
+# LibraryStorage builds the sheet indexes once per loaded workbook
+# and keeps them up to date as rows are appended, updated or deleted,
+# so lookups no longer scan a whole sheet.
+#
+# Every sheet index exposes the same hooks, called after the change
+# has been applied to the worksheet:
+#   on_append(row_idx, values)
+#   on_update(ws, row_idx, column, value)
+#   on_delete(row_idx)
+#   on_clear(row_idx, old_values)   row emptied in place (tombstone)
+# ------------------------------------------------------------
+
+import re
+from bisect import bisect_left, insort
+
+from models import parse_date
+
+
+def is_open(return_date):
+    """True if a Transactions ReturnDate value means the book is still out."""
+    return return_date is None or return_date == ""
+
+
+class KeyIndex:
+    """Maps the ID in a sheet's first column to its row number."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def build(self, ws):
+        """Indexes every non-empty ID in the worksheet."""
+        self.rows = {}
+        for row_idx, (value,) in enumerate(ws.iter_rows(min_row=2, max_col=1, values_only=True), start=2):
+            if value is not None and value != "":
+                # Keep the first occurrence, as a top-down scan would.
+                self.rows.setdefault(str(value), row_idx)
+        return self
+
+    def get(self, key):
+        """Returns the row number for an ID, or None."""
+        return self.rows.get(str(key))
+
+    def on_append(self, row_idx, values):
+        if values and values[0] is not None and values[0] != "":
+            self.rows.setdefault(str(values[0]), row_idx)
+
+    def on_update(self, ws, row_idx, column, value):
+        if column != 1:
+            return
+        for key, idx in list(self.rows.items()):
+            if idx == row_idx:
+                del self.rows[key]
+        if value is not None and value != "":
+            self.rows.setdefault(str(value), row_idx)
+
+    def on_clear(self, row_idx, old_values):
+        """Forgets the ID of a row cleared in place; no other row moves."""
+        if old_values and self.rows.get(str(old_values[0])) == row_idx:
+            del self.rows[str(old_values[0])]
+
+    def on_delete(self, row_idx):
+        """Forgets the ID at row_idx and shifts the rows below it up by one."""
+        for key, idx in list(self.rows.items()):
+            if idx == row_idx:
+                del self.rows[key]
+            elif idx > row_idx:
+                self.rows[key] = idx - 1
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class OpenLoanIndex:
+    """Tracks open (unreturned) loans in the Transactions sheet.
+
+    Loans are indexed by (MemberID, BookID) and counted per member, so
+    returns and the delete-member guard never touch closed history.
+    """
+
+    def __init__(self):
+        self.open_rows = {}     # row number -> (member, book)
+        self.by_pair = {}       # (member, book) -> [row numbers], oldest first
+        self.by_member = {}     # member -> number of open loans
+
+    def build(self, ws):
+        """Indexes every open loan in the Transactions worksheet."""
+        self.open_rows, self.by_pair, self.by_member = {}, {}, {}
+        for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_col=5, values_only=True), start=2):
+            if row[0] is None and row[1] is None:
+                continue
+            if is_open(row[4]):
+                self._add(row_idx, row[1], row[2])
+        return self
+
+    def _add(self, row_idx, member_id, book_id):
+        member_id, book_id = str(member_id), str(book_id)
+        self.open_rows[row_idx] = (member_id, book_id)
+        insort(self.by_pair.setdefault((member_id, book_id), []), row_idx)
+        self.by_member[member_id] = self.by_member.get(member_id, 0) + 1
+
+    def _remove(self, row_idx):
+        member_id, book_id = self.open_rows.pop(row_idx)
+        rows = self.by_pair[(member_id, book_id)]
+        rows.remove(row_idx)
+        if not rows:
+            del self.by_pair[(member_id, book_id)]
+        self.by_member[member_id] -= 1
+        if not self.by_member[member_id]:
+            del self.by_member[member_id]
+
+    def find(self, member_id, book_id):
+        """Returns the row number of the oldest open loan for the pair, or None."""
+        rows = self.by_pair.get((str(member_id), str(book_id)))
+        return rows[0] if rows else None
+
+    def open_count(self, member_id):
+        """Returns how many books the member currently has issued."""
+        return self.by_member.get(str(member_id), 0)
+
+    def on_append(self, row_idx, values):
+        if len(values) >= 5 and is_open(values[4]) and (values[1] is not None or values[2] is not None):
+            self._add(row_idx, values[1], values[2])
+
+    def on_update(self, ws, row_idx, column, value):
+        if column == 5:
+            if row_idx in self.open_rows and not is_open(value):
+                self._remove(row_idx)
+            elif row_idx not in self.open_rows and is_open(value):
+                member_id = ws.cell(row=row_idx, column=2).value
+                book_id = ws.cell(row=row_idx, column=3).value
+                if member_id is not None or book_id is not None:
+                    self._add(row_idx, member_id, book_id)
+        elif column in (2, 3) and row_idx in self.open_rows:
+            self._remove(row_idx)
+            self._add(row_idx, ws.cell(row=row_idx, column=2).value, ws.cell(row=row_idx, column=3).value)
+
+    def on_clear(self, row_idx, old_values):
+        if row_idx in self.open_rows:
+            self._remove(row_idx)
+
+    def on_delete(self, row_idx):
+        """Drops the loan at row_idx and shifts the rows below it up by one."""
+        if row_idx in self.open_rows:
+            self._remove(row_idx)
+        shifted = [(idx, pair) for idx, pair in self.open_rows.items() if idx > row_idx]
+        for idx, _ in shifted:
+            self._remove(idx)
+        for idx, (member_id, book_id) in shifted:
+            self._add(idx - 1, member_id, book_id)
+
+
+def tokenize(text):
+    """Splits text into lower-case word tokens."""
+    return re.findall(r"\w+", str(text or "").lower())
+
+
+class CatalogIndex:
+    """Inverted index over book titles and authors.
+
+    Supports prefix matching and multi-term AND queries. Unlike the
+    indexes above it is keyed by BookID rather than by sheet row, so it
+    works on top of any storage engine; BookManager keeps it current as
+    books are added or deleted.
+    """
+
+    # Score for a query term matching a token, by field and match kind
+    TITLE_WEIGHT = 2
+    AUTHOR_WEIGHT = 1
+    EXACT_BONUS = 2
+
+    def __init__(self):
+        self.postings = {}      # token -> {book_id: field weight}
+        self.tokens = []        # sorted distinct tokens, for prefix lookups
+        self.books = {}         # book_id -> tokens indexed for it
+
+    def build(self, rows):
+        """Indexes every (BookID, Title, Author, ...) row."""
+        self.postings, self.tokens, self.books = {}, [], {}
+        for row in rows:
+            self.add(row[0], row[1], row[2])
+        return self
+
+    def add(self, book_id, title, author):
+        """Indexes (or re-indexes) one book."""
+        book_id = str(book_id)
+        if book_id in self.books:
+            self.remove(book_id)
+        weights = {}
+        for token in tokenize(author):
+            weights[token] = self.AUTHOR_WEIGHT
+        for token in tokenize(title):
+            weights[token] = weights.get(token, 0) + self.TITLE_WEIGHT
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                insort(self.tokens, token)
+            posting[book_id] = weight
+        self.books[book_id] = list(weights)
+
+    def remove(self, book_id):
+        """Drops one book from the index."""
+        book_id = str(book_id)
+        for token in self.books.pop(book_id, []):
+            posting = self.postings[token]
+            posting.pop(book_id, None)
+            if not posting:
+                del self.postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    def _term_scores(self, term):
+        """Returns {book_id: best score} for books with a token starting with term."""
+        scores = {}
+        i = bisect_left(self.tokens, term)
+        while i < len(self.tokens) and self.tokens[i].startswith(term):
+            token = self.tokens[i]
+            bonus = self.EXACT_BONUS if token == term else 1
+            for book_id, weight in self.postings[token].items():
+                score = weight * bonus
+                if score > scores.get(book_id, 0):
+                    scores[book_id] = score
+            i += 1
+        return scores
+
+    def search(self, query):
+        """Returns BookIDs matching every term of the query, best match first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        totals = None
+        # Narrow with the rarest-looking (longest) term first.
+        for term in sorted(set(terms), key=len, reverse=True):
+            scores = self._term_scores(term)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {book_id: totals[book_id] + score
+                          for book_id, score in scores.items() if book_id in totals}
+            if not totals:
+                return []
+        return sorted(totals, key=lambda book_id: (-totals[book_id], book_id))
+
+
+class DueDateIndex:
+    """Open loans in the Transactions sheet ordered by issue date.
+
+    Entries are (IssueDate day ordinal, row number) kept in a sorted list,
+    so "issued before X" (overdue) and "issued between X and Y" (due soon)
+    only touch the matching loans. Loans with an unreadable IssueDate are
+    left out, as the overdue report has always skipped them.
+    """
+
+    def __init__(self):
+        self.entries = []       # sorted (issue ordinal, row number)
+        self.ordinals = {}      # row number -> issue ordinal
+
+    def build(self, ws):
+        """Indexes every open loan in the Transactions worksheet."""
+        self.entries, self.ordinals = [], {}
+        for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_col=5, values_only=True), start=2):
+            if (row[0] is not None or row[1] is not None) and is_open(row[4]):
+                self._add(row_idx, row[3], presorted=True)
+        self.entries.sort()
+        return self
+
+    def _add(self, row_idx, issue_date, presorted=False):
+        issued = parse_date(issue_date)
+        if issued is None:
+            return
+        entry = (issued.toordinal(), row_idx)
+        self.ordinals[row_idx] = entry[0]
+        if presorted:
+            self.entries.append(entry)
+        else:
+            insort(self.entries, entry)
+
+    def _remove(self, row_idx):
+        ordinal = self.ordinals.pop(row_idx, None)
+        if ordinal is not None:
+            del self.entries[bisect_left(self.entries, (ordinal, row_idx))]
+
+    def rows_issued_between(self, start=None, end=None):
+        """Returns row numbers of open loans issued in [start, end), oldest first.
+
+        start and end are dates; either may be None for an open range.
+        """
+        lo = 0 if start is None else bisect_left(self.entries, (start.toordinal(), 0))
+        hi = len(self.entries) if end is None else bisect_left(self.entries, (end.toordinal(), 0))
+        return [row_idx for _, row_idx in self.entries[lo:hi]]
+
+    def on_append(self, row_idx, values):
+        if len(values) >= 5 and is_open(values[4]) and (values[0] is not None or values[1] is not None):
+            self._add(row_idx, values[3])
+
+    def on_update(self, ws, row_idx, column, value):
+        if column == 5:
+            if not is_open(value):
+                self._remove(row_idx)
+            elif row_idx not in self.ordinals:
+                self._add(row_idx, ws.cell(row=row_idx, column=4).value)
+        elif column == 4 and row_idx in self.ordinals:
+            self._remove(row_idx)
+            self._add(row_idx, value)
+
+    def on_clear(self, row_idx, old_values):
+        self._remove(row_idx)
+
+    def on_delete(self, row_idx):
+        """Drops the loan at row_idx and shifts the rows below it up by one."""
+        self._remove(row_idx)
+        if any(idx > row_idx for idx in self.ordinals):
+            self.ordinals = {(idx - 1 if idx > row_idx else idx): ordinal
+                             for idx, ordinal in self.ordinals.items()}
+            self.entries = sorted((ordinal, idx) for idx, ordinal in self.ordinals.items())
@@ -0,0 +1,221 @@
+# instrumentation.py
+# ------------------------------------------------------------
+# Opt-in timing of the hot paths in storage and the managers.
+#
+# Off unless the LIBRARY_PROFILE environment variable is set; install()
+# then does nothing, so a normal run carries no extra cost at all.
+#   LIBRARY_PROFILE=summary  print a per-session table on exit
+#   LIBRARY_PROFILE=trace    also write one JSON line per timed call
+#                            to LIBRARY_PROFILE_FILE (library_trace.jsonl)
+#
+# When on, install() wraps, for the life of the process:
+#   - LibraryStorage.get_workbook / save_workbook / checkpoint (and the
+#     service's background write_checkpoint), the openpyxl load and
+#     full-file write, and the journal append
+#   - SQLiteStorage.commit
+#   - every public method of the managers (menu loops excepted)
+# Each wrapped call counts calls and time, plus rows read through the
+# storage row API (get_rows, stream_rows, open-loan lookups) and bytes
+# written to library.xlsx / its journal while it ran. Nested calls
+# count for every caller, so BookManager.view_books shows the rows
+# its storage calls scanned.
+#
+# Usage:
+#   LIBRARY_PROFILE=summary python main.py
+# ------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+
+# -------- CONFIGURATION --------
+PROFILE_ENV = "LIBRARY_PROFILE"
+TRACE_FILE_ENV = "LIBRARY_PROFILE_FILE"
+DEFAULT_TRACE_FILE = "library_trace.jsonl"
+# -------------------------------
+
+# Storage methods that hand out rows; their rows count as scanned
+ROW_SOURCES = ("get_rows", "stream_rows", "get_open_transactions", "get_open_transactions_issued_between")
+
+_stats = {}                 # name -> {"calls", "seconds", "max_seconds", "rows", "bytes"}
+_stats_lock = threading.Lock()
+_local = threading.local()  # .stack: counters of the calls in progress on this thread
+_trace = None
+_started = None
+_installed = False
+
+
+def enabled():
+    return bool(os.environ.get(PROFILE_ENV))
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _count(field, amount):
+    """Adds to a counter of every call in progress on this thread."""
+    for counters in _stack():
+        counters[field] += amount
+
+
+def _record(name, seconds, counters, depth):
+    with _stats_lock:
+        entry = _stats.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0})
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["rows"] += counters["rows"]
+        entry["bytes"] += counters["bytes"]
+        if _trace is not None:
+            _trace.write(json.dumps({
+                "name": name, "at": round(time.time(), 6), "ms": round(seconds * 1000, 3),
+                "rows": counters["rows"], "bytes": counters["bytes"], "depth": depth,
+                "thread": threading.current_thread().name,
+            }) + "\n")
+
+
+def timed(name, func):
+    """Returns func wrapped with a timer and counters recorded under name."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        counters = {"rows": 0, "bytes": 0}
+        stack.append(counters)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            _record(name, seconds, counters, len(stack))
+    return wrapper
+
+
+def counting_rows(func):
+    """Wraps a storage row source so every row it yields is counted."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rows = func(*args, **kwargs)
+        if isinstance(rows, list):
+            if not getattr(_local, "source_depth", 0):
+                _count("rows", len(rows))
+            return rows
+        return _counted(rows)
+    return wrapper
+
+
+def _counted(rows):
+    # A row source built on another (stream_rows on get_rows) counts each row once
+    rows = iter(rows)
+    while True:
+        depth = getattr(_local, "source_depth", 0)
+        _local.source_depth = depth + 1
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        finally:
+            _local.source_depth = depth
+        if not depth:
+            _count("rows", 1)
+        yield row
+
+
+def counting_bytes(func, path_of):
+    """Wraps a writer so the growth of the file path_of(self) counts as bytes written."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        path = path_of(self)
+        before = os.path.getsize(path) if os.path.exists(path) else 0
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            after = os.path.getsize(path) if os.path.exists(path) else 0
+            # A full rewrite writes the whole new file, an append only the tail
+            _count("bytes", after - before if func.__name__ == "_append_journal_record" else after)
+    return wrapper
+
+
+def _wrap_methods(cls, names=None):
+    """Times the named methods of cls, or all its public ones except menu loops."""
+    if names is None:
+        names = [name for name, value in vars(cls).items()
+                 if callable(value) and not isinstance(value, (staticmethod, classmethod))
+                 and not name.startswith("_") and not name.endswith("menu")]
+    for name in names:
+        setattr(cls, name, timed(f"{cls.__name__}.{name}", getattr(cls, name)))
+
+
+def install():
+    """Instruments storage and the managers if LIBRARY_PROFILE is set. Returns True if it did."""
+    global _trace, _started, _installed
+    if _installed or not enabled():
+        return _installed
+    _installed = True
+    _started = time.perf_counter()
+
+    import storage
+    from sqlite_storage import SQLiteStorage
+    from books import BookManager
+    from members import MemberManager
+    from transactions import TransactionManager
+    from reports import ReportGenerator
+    from archive import TransactionArchiver
+    from importer import BulkImporter
+    from backup import BackupManager
+    from login import AuthManager
+
+    library = storage.LibraryStorage
+    library._write_file = counting_bytes(library._write_file, lambda s: s.filename)
+    library._append_journal_record = counting_bytes(library._append_journal_record, lambda s: s.journal_file)
+    _wrap_methods(library, ["get_workbook", "save_workbook", "checkpoint", "write_checkpoint",
+                            "_write_file", "_append_journal_record"])
+    # Callers import load_workbook from openpyxl when they need it
+    import openpyxl
+    openpyxl.load_workbook = timed("openpyxl.load_workbook", openpyxl.load_workbook)
+    _wrap_methods(SQLiteStorage, ["commit"])
+    for cls in (library, SQLiteStorage):
+        for name in ROW_SOURCES:
+            setattr(cls, name, counting_rows(getattr(cls, name)))
+
+    for cls in (BookManager, MemberManager, TransactionManager, ReportGenerator,
+                TransactionArchiver, BulkImporter, BackupManager, AuthManager):
+        _wrap_methods(cls)
+
+    if os.environ.get(PROFILE_ENV) == "trace":
+        _trace = open(os.environ.get(TRACE_FILE_ENV, DEFAULT_TRACE_FILE), "a", encoding="utf-8", buffering=1)
+    atexit.register(report)
+    return True
+
+
+def summary():
+    """Returns the per-name counters collected so far, slowest total first."""
+    with _stats_lock:
+        return sorted(((name, dict(entry)) for name, entry in _stats.items()),
+                      key=lambda item: item[1]["seconds"], reverse=True)
+
+
+def report(out=None):
+    """Prints the session summary (to stderr, so menus stay readable)."""
+    out = out or sys.stderr
+    rows = summary()
+    if not rows:
+        return
+    session = time.perf_counter() - _started if _started else 0
+    print(f"\nPROFILE SUMMARY (session {session:.1f}s)", file=out)
+    print(f"{'name':<48}{'calls':>7}{'total ms':>11}{'avg ms':>9}{'max ms':>9}{'rows':>10}{'bytes':>11}", file=out)
+    for name, entry in rows:
+        print(f"{name:<48}{entry['calls']:>7}{entry['seconds'] * 1000:>11.1f}"
+              f"{entry['seconds'] * 1000 / entry['calls']:>9.2f}{entry['max_seconds'] * 1000:>9.2f}"
+              f"{entry['rows']:>10}{entry['bytes']:>11}", file=out)
+    if _trace is not None:
+        _trace.flush()
+        print(f"Trace written to {_trace.name}", file=out)
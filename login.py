@@ -1,45 +1,207 @@
 # login.py
+# ------------------------------------------------------------
+# User accounts, password checks and session tokens.
+#
+#   - users.xlsx is read into a dict once and read again only when
+#     the file changes on disk
+#   - Passwords are stored as salted PBKDF2-SHA256 hashes
+#     ("pbkdf2_sha256$<iterations>$<salt>$<hash>"); plain-text
+#     passwords found in an older users.xlsx are hashed in place the
+#     first time the file is loaded
+#   - Successful checks are remembered in a small LRU cache keyed by
+#     an HMAC of the credentials (never the password itself), so a
+#     repeated login does not pay for PBKDF2 again
+#   - login() hands out short-lived session tokens that the service
+#     accepts instead of a password on every call
+# ------------------------------------------------------------
+
 import os
-from openpyxl import Workbook, load_workbook
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+# -------- CONFIGURATION --------
+PBKDF2_ITERATIONS = 200000
+SALT_BYTES = 16
+
+# Successful password checks remembered per process
+VERIFY_CACHE_SIZE = 256
+
+# Seconds a session token stays valid after it was issued
+SESSION_TTL = 30 * 60
+# -------------------------------
+
+HASH_PREFIX = "pbkdf2_sha256"
+
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    """Returns the stored form of a password with a fresh random salt."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{HASH_PREFIX}${iterations}${salt.hex()}${digest.hex()}"
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(HASH_PREFIX + "$")
+
+
+def check_password(password, stored):
+    """True if password matches the stored hash (or legacy plain text)."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(str(password).encode("utf-8"), str(stored or "").encode("utf-8"))
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), expected)
+
 
 class AuthManager:
-    def __init__(self, user_file="users.xlsx"):
+    def __init__(self, user_file="users.xlsx", session_ttl=SESSION_TTL):
         self.user_file = user_file
         self.sheet_name = "Users"
+        self.session_ttl = session_ttl
+        self.users = {}             # username -> (stored password hash, role)
+        self._signature = None      # (mtime, size) of users.xlsx when loaded
+        # Per-process key for the verification cache; never stored
+        self._cache_key = secrets.token_bytes(32)
+        self._verified = OrderedDict()
+        self._sessions = {}         # token -> (username, role, expiry)
+        # The service checks passwords on worker threads
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
 
     def create_default_users(self):
         """Creates users.xlsx with default accounts if it does NOT exist."""
         if not os.path.exists(self.user_file):
+            from openpyxl import Workbook
+
             wb = Workbook()
             ws = wb.active
             ws.title = self.sheet_name
             ws.append(["Username", "Password", "Role"])
-            ws.append(["admin", "admin123", "ADMIN"])
-            ws.append(["librarian", "lib123", "LIBRARIAN"])
+            ws.append(["admin", hash_password("admin123"), "ADMIN"])
+            ws.append(["librarian", hash_password("lib123"), "LIBRARIAN"])
             wb.save(self.user_file)
 
+    def _file_signature(self):
+        st = os.stat(self.user_file)
+        return (st.st_mtime_ns, st.st_size)
+
+    def load_users(self):
+        """Returns the username -> (hash, role) table, re-reading users.xlsx only if it changed."""
+        # One reader at a time: the app may pre-load users on a background thread
+        with self._load_lock:
+            if not os.path.exists(self.user_file):
+                self.create_default_users()
+            signature = self._file_signature()
+            if signature == self._signature:
+                return self.users
+
+            from openpyxl import load_workbook
+
+            wb = load_workbook(self.user_file)
+            ws = wb[self.sheet_name]
+            users, migrated = {}, False
+            for row in ws.iter_rows(min_row=2, max_col=3):
+                if not any(cell.value for cell in row):
+                    continue
+                user_cell, pass_cell, role_cell = row
+                if not is_hashed(pass_cell.value):
+                    pass_cell.value = hash_password(str(pass_cell.value or ""))
+                    migrated = True
+                users[user_cell.value] = (pass_cell.value, role_cell.value)
+
+            if migrated:
+                # Write the hashes next to the file and swap it in, so a crash
+                # never leaves users.xlsx half written
+                temp_file = self.user_file + ".tmp"
+                wb.save(temp_file)
+                os.replace(temp_file, self.user_file)
+                signature = self._file_signature()
+            with self._lock:
+                self.users = users
+                self._signature = signature
+                self._verified.clear()
+            return users
+
+    def _verify_key(self, username, password, stored):
+        message = "\0".join((str(username), str(password), stored)).encode("utf-8")
+        return hmac.new(self._cache_key, message, hashlib.sha256).digest()
+
     def authenticate(self, username, password):
-        """Checks credentials against users.xlsx."""
-        if not os.path.exists(self.user_file):
-            self.create_default_users()
-            
-        wb = load_workbook(self.user_file)
-        ws = wb[self.sheet_name]
-
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            stored_user, stored_pass, role = row
-            if username == stored_user and password == stored_pass:
+        """Checks credentials against users.xlsx. Returns the role or None."""
+        user = self.load_users().get(username)
+        if user is None:
+            return None
+        stored, role = user
+
+        # The stored hash is part of the key, so a changed password
+        # never matches an old entry.
+        key = self._verify_key(username, password, stored)
+        with self._lock:
+            if key in self._verified:
+                self._verified.move_to_end(key)
                 return role
-        return None
+        if not check_password(password, stored):
+            return None
+        with self._lock:
+            self._verified[key] = True
+            while len(self._verified) > VERIFY_CACHE_SIZE:
+                self._verified.popitem(last=False)
+        return role
+
+    # -------- SESSION TOKENS --------
+    def login(self, username, password):
+        """Checks credentials and returns (token, role), or (None, None)."""
+        role = self.authenticate(username, password)
+        if role is None:
+            return None, None
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            for old in [t for t, (_, _, expiry) in self._sessions.items() if expiry <= now]:
+                del self._sessions[old]
+            self._sessions[token] = (username, role, now + self.session_ttl)
+        return token, role
+
+    def check_token(self, token):
+        """Returns (username, role) for a live session token, or None."""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            username, role, expiry = session
+            if expiry <= time.monotonic():
+                del self._sessions[token]
+                return None
+        # An account removed from users.xlsx loses its sessions too
+        if username not in self.load_users():
+            self.logout(token)
+            return None
+        return username, role
+
+    def logout(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def show_login_menu(self):
+        print("LIBRARY MANAGEMENT SYSTEM")
+        print("1. Login")
+        print("2. Exit")
 
     def login_menu(self):
-        """Displays the login menu and handles user input."""
-        self.create_default_users()
+        """Displays the login menu and handles user input.
+
+        users.xlsx is not read until credentials are entered, so the
+        menu shows up straight away.
+        """
         while True:
-            print("LIBRARY MANAGEMENT SYSTEM")
-            print("1. Login")
-            print("2. Exit")
+            self.show_login_menu()
 
             choice = input("Enter choice: ")
             if choice == "1":
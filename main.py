@@ -1,24 +1,75 @@
 # main.py
-from storage import LibraryStorage
+# ------------------------------------------------------------
+# Entry point of the Library Management System.
+#
+# Only the login screen's code is imported up front, so the first
+# prompt appears at once however large the library is. The managers
+# and openpyxl are imported, and users.xlsx / library.xlsx loaded, on
+# a background thread while the user is typing their credentials.
+#
+# Usage:
+#   python main.py
+#   python main.py --startup-time   (print time to the first prompt and exit)
+# ------------------------------------------------------------
+import time
+
+STARTED = time.perf_counter()
+
+import sys
+import threading
+
 from login import AuthManager
-from books import BookManager
-from members import MemberManager
-from transactions import TransactionManager
-from reports import ReportGenerator
-from backup import BackupManager
+import instrumentation
+
+# -------- CONFIGURATION --------
+# Load the library in the background while the login menu is shown
+PREWARM = True
+# -------------------------------
 
 class LibraryApp:
     def __init__(self):
+        self.auth_manager = AuthManager()
+        # Storage and the managers are created on first login
+        self.storage = None
+        self.prewarm_thread = None
+        if PREWARM:
+            self.prewarm_thread = threading.Thread(target=self.prewarm, name="prewarm", daemon=True)
+            self.prewarm_thread.start()
+
+    def prewarm(self):
+        """Imports the managers and loads the user and library files ahead of first use."""
+        try:
+            import storage, books, members, transactions, reports, backup
+            self.auth_manager.load_users()
+            storage.prewarm()
+        except Exception:
+            # Whatever failed here is simply done again, with its error shown, on first use
+            pass
+
+    def load_managers(self):
+        """Creates storage and the managers the first time someone logs in."""
+        if self.storage is not None:
+            return
+        if self.prewarm_thread is not None:
+            self.prewarm_thread.join()
+        from storage import create_storage
+        from books import BookManager
+        from members import MemberManager
+        from transactions import TransactionManager
+        from reports import ReportGenerator
+        from backup import BackupManager
+
         # Initialize Core Storage
-        self.storage = LibraryStorage()
-        
+        self.storage = create_storage()
+
         # Initialize Managers
-        self.auth_manager = AuthManager()
         self.book_manager = BookManager(self.storage)
         self.member_manager = MemberManager(self.storage)
         self.transaction_manager = TransactionManager(self.storage)
         self.report_generator = ReportGenerator(self.storage)
-        self.backup_manager = BackupManager()
+        self.backup_manager = BackupManager(files_to_backup=self.storage.data_files() + ["users.xlsx"],
+                                            storage=self.storage)
+        self.backup_manager.start_scheduler()
 
     def run(self):
         """Orchestrates the application flow."""
@@ -28,14 +79,26 @@ class LibraryApp:
 
             if user_role:
                 # 2. Main Menu Phase
+                self.load_managers()
                 self.show_main_menu(user_role)
             else:
                 # Exit
+                if self.storage is not None:
+                    self.backup_manager.stop_scheduler()
+                    self.storage.close()
                 print("\n[INFO] Exiting system. Goodbye!")
                 break
 
     def show_main_menu(self, user_role):
-        """Handles the main menu routing."""
+        """Handles the main menu routing.
+
+        A busy library (lock held too long by another desk, or saves
+        refused on every retry) reported from any read path sends the
+        user back here instead of ending the program.
+        """
+        from storage import StaleWorkbookError
+        from filelock import LockTimeout
+
         while True:
             print(f"\nMAIN MENU ({user_role})")
             print("1. Books Menu")
@@ -47,22 +110,31 @@ class LibraryApp:
             
             choice = input("Enter choice: ")
 
-            if choice == "1":
-                self.book_manager.books_menu()
-            elif choice == "2":
-                self.member_manager.members_menu()
-            elif choice == "3":
-                self.transaction_manager.transactions_menu()
-            elif choice == "4":
-                self.report_generator.reports_menu()
-            elif choice == "5":
-                self.backup_manager.backup_menu()
-            elif choice == "6":
-                print("\nLogging out...\n")
-                break
-            else:
-                print("\n[ERROR] Invalid choice. Please try again.\n")
+            try:
+                if choice == "1":
+                    self.book_manager.books_menu()
+                elif choice == "2":
+                    self.member_manager.members_menu()
+                elif choice == "3":
+                    self.transaction_manager.transactions_menu()
+                elif choice == "4":
+                    self.report_generator.reports_menu()
+                elif choice == "5":
+                    self.backup_manager.backup_menu()
+                elif choice == "6":
+                    print("\nLogging out...\n")
+                    break
+                else:
+                    print("\n[ERROR] Invalid choice. Please try again.\n")
+            except (StaleWorkbookError, LockTimeout) as e:
+                print(f"\n[ERROR] {e}\n")
 
 if __name__ == "__main__":
+    # Opt-in timing (LIBRARY_PROFILE=summary|trace); nothing is wrapped otherwise
+    instrumentation.install()
     app = LibraryApp()
+    if "--startup-time" in sys.argv:
+        app.auth_manager.show_login_menu()
+        print(f"[INFO] First prompt after {(time.perf_counter() - STARTED) * 1000:.1f} ms")
+        sys.exit(0)
     app.run()
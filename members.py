@@ -1,119 +1,117 @@
 # members.py
 from models import Member
+from storage import StaleWorkbookError
+from filelock import LockTimeout
+from importer import BulkImporter, print_import_report, prompt_import_path
 
 class MemberManager:
     def __init__(self, storage):
         self.storage = storage
         self.sheet_name = "Members"
+        self.first_id = 1001    # Member IDs start from 1001
 
-    def generate_member_id(self, ws):
-        """Generates a simple incremental Member ID."""
-        last_row = ws.max_row
-        if last_row <= 1:
-            return 1001  # Start from 1001
-        last_id = ws.cell(row=last_row, column=1).value
-        try:
-            return int(last_id) + 1
-        except (TypeError, ValueError):
-            return 1001
-
-    def add_member(self):
-        """Adds a new library member to Excel."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
-        name = input("Enter Member Name: ")
-        phone = input("Enter Phone Number: ")
+    def generate_member_id(self):
+        """Allocates the next incremental Member ID."""
+        return self.storage.allocate_ids(self.sheet_name, start=self.first_id)
 
-        member_id = self.generate_member_id(ws)
-        member = Member(member_id, name, phone)
-
-        ws.append([
+    def create_member(self, name, phone):
+        """Adds a member without saving and returns the Member ID."""
+        member = Member(self.generate_member_id(), name, phone)
+        self.storage.add_row(self.sheet_name, [
             member.member_id,
             member.name,
             member.phone,
             member.books_issued
         ])
+        return member.member_id
+
+    def remove_member(self, member_id):
+        """Deletes a member without saving.
+
+        Returns None on success, or the reason the member cannot be deleted.
+        """
+        # 1. Check for Active Transactions
+        if self.storage.has_open_transactions(member_id):
+            return f"Cannot delete Member {member_id}. They still have a book issued!"
+
+        # 2. Proceed with deletion
+        if not self.storage.delete_row(self.sheet_name, member_id):
+            return "Member not found."
+        return None
 
-        self.storage.save_workbook(wb)
+    def add_member(self):
+        """Adds a new library member."""
+        name = input("Enter Member Name: ")
+        phone = input("Enter Phone Number: ")
+
+        try:
+            member_id = self.storage.run_with_retry(lambda: self.create_member(name, phone))
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
         print(f"\n[SUCCESS] Member added successfully.")
-        print(f"Member ID: {member.member_id}\n")
+        print(f"Member ID: {member_id}\n")
 
     def view_members(self):
         """Displays all members in a readable format."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
         print("\nLIBRARY MEMBERS\n")
-        if ws.max_row <= 1:
-            print("[INFO] No members found.\n")
-            return
-
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
+        found = False
+        for row in self.storage.get_rows(self.sheet_name):
             member_id, name, phone, books_issued = row
             print(f"ID: {member_id} | Name: {name} | Phone: {phone} | Books Issued: {books_issued}")
+            found = True
+
+        if not found:
+            print("[INFO] No members found.")
         print()
 
     def search_member(self):
         """Searches for a member by MemberID."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
         search_id = input("Enter Member ID to search: ")
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            member_id, name, phone, books_issued = row
-            if str(member_id) == search_id:
-                print("\nMember Found:")
-                print(f"ID: {member_id} | Name: {name} | Phone: {phone} | Books Issued: {books_issued}\n")
-                return
+        row = self.storage.get_row(self.sheet_name, search_id)
+        if row is None:
+            print("\n[INFO] Member not found.\n")
+            return
 
-        print("\n[INFO] Member not found.\n")
+        member_id, name, phone, books_issued = row
+        print("\nMember Found:")
+        print(f"ID: {member_id} | Name: {name} | Phone: {phone} | Books Issued: {books_issued}\n")
 
     def delete_member(self):
         """Deletes a member ONLY if they have no active issued books."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
         delete_id = input("Enter Member ID to delete: ")
 
-        # 1. Check for Active Transactions
-        if "Transactions" in wb.sheetnames:
-            ws_trans = wb["Transactions"]
-            for row in ws_trans.iter_rows(min_row=2, values_only=True):
-                if not any(row): continue
-                t_mem_id = str(row[1])
-                t_return_date = row[4]
-                if t_mem_id == delete_id and (t_return_date is None or t_return_date == ""):
-                    print(f"\n[ERROR] Cannot delete Member {delete_id}. They still have a book issued!")
-                    return
-
-        # 2. Proceed with deletion
-        found = False
-        rows_to_keep = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            member_id = str(row[0])
-            if member_id != delete_id:
-                rows_to_keep.append(row)
-            else:
-                found = True
-
-        if not found:
-            print("\n[ERROR] Member not found.\n")
+        try:
+            error = self.storage.run_with_retry(lambda: self.remove_member(delete_id))
+        except PermissionError:
+            print("\n[ERROR] Close 'library.xlsx' and try again!")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
             return
 
-        # Clear and Rewrite
-        ws.delete_rows(2, ws.max_row)
-        for row in rows_to_keep:
-            ws.append(list(row))
+        if error:
+            print(f"\n[ERROR] {error}\n")
+            return
+        print("\n[SUCCESS] Member deleted successfully.\n")
 
+    def bulk_import_members(self):
+        """Imports many members at once from a CSV or .xlsx file (Name, Phone)."""
+        path = prompt_import_path()
+        if path is None:
+            return
         try:
-            self.storage.save_workbook(wb)
-            print("\n[SUCCESS] Member deleted successfully.\n")
+            result = BulkImporter(self.storage).import_members(path, self.first_id)
         except PermissionError:
-            print("\n[ERROR] Close 'library.xlsx' and try again!")
+            print("\n[ERROR] Close 'library.xlsx' and try again!\n")
+            return
+        except Exception as e:
+            print(f"\n[ERROR] Import failed, nothing was saved: {e}\n")
+            return
+        print_import_report(result)
 
     def members_menu(self):
         """Displays the Members menu and routes user choices."""
@@ -123,7 +121,8 @@ class MemberManager:
             print("2. View Members")
             print("3. Search Member")
             print("4. Delete Member")
-            print("5. Back to Main Menu")
+            print("5. Bulk Import Members")
+            print("6. Back to Main Menu")
 
             choice = input("Enter choice: ")
             if choice == "1":
@@ -135,6 +134,8 @@ class MemberManager:
             elif choice == "4":
                 self.delete_member()
             elif choice == "5":
+                self.bulk_import_members()
+            elif choice == "6":
                 break
             else:
                 print("\n[ERROR] Invalid choice. Try again.\n")
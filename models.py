@@ -1,26 +1,73 @@
 # models.py
+import math
+from array import array
+from datetime import date, datetime
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Stored in TransactionTable columns for a missing/unreadable date or ID
+NO_DATE = -1
+NO_ID = -1
+
+
+def parse_date(value):
+    """Returns a date for an Excel/SQLite date value ('YYYY-MM-DD' or datetime), or None."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.strptime(value, DATE_FORMAT).date()
+        except ValueError:
+            return None
+    return None
+
 
 class Book:
-    def __init__(self, book_id, title, author, quantity):
+    __slots__ = ("book_id", "title", "author", "quantity", "issued")
+
+    def __init__(self, book_id, title, author, quantity, issued=0):
         self.book_id = book_id
         self.title = title
         self.author = author
         self.quantity = quantity
+        self.issued = issued
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds a Book from a Books row (BookID, Title, Author, Quantity, Issued)."""
+        return cls(row[0], row[1], row[2], row[3] or 0, row[4] or 0)
+
+    def to_row(self):
+        return [self.book_id, self.title, self.author, self.quantity, self.issued]
 
     def __str__(self):
         return f"ID: {self.book_id} | Title: {self.title} | Author: {self.author} | Qty: {self.quantity}"
 
 class Member:
+    __slots__ = ("member_id", "name", "phone", "books_issued")
+
     def __init__(self, member_id, name, phone, books_issued=0):
         self.member_id = member_id
         self.name = name
         self.phone = phone
         self.books_issued = books_issued
 
+    @classmethod
+    def from_row(cls, row):
+        """Builds a Member from a Members row (MemberID, Name, Phone, BooksIssued)."""
+        return cls(row[0], row[1], row[2], row[3] or 0)
+
+    def to_row(self):
+        return [self.member_id, self.name, self.phone, self.books_issued]
+
     def __str__(self):
         return f"ID: {self.member_id} | Name: {self.name} | Phone: {self.phone} | Books Issued: {self.books_issued}"
 
 class Transaction:
+    __slots__ = ("transaction_id", "member_id", "book_id", "issue_date", "return_date", "fine")
+
     def __init__(self, transaction_id, member_id, book_id, issue_date, return_date=None, fine=0):
         self.transaction_id = transaction_id
         self.member_id = member_id
@@ -29,7 +76,158 @@ class Transaction:
         self.return_date = return_date
         self.fine = fine
 
+    @classmethod
+    def from_row(cls, row):
+        """Builds a Transaction from a Transactions row."""
+        return cls(row[0], row[1], row[2], row[3], row[4] or None, row[5] or 0)
+
+    def to_row(self):
+        return [self.transaction_id, self.member_id, self.book_id,
+                self.issue_date, self.return_date or "", self.fine]
+
     def __str__(self):
         return (f"Trans ID: {self.transaction_id} | Member: {self.member_id} | "
                 f"Book: {self.book_id} | Issued: {self.issue_date} | "
                 f"Returned: {self.return_date or 'N/A'} | Fine: {self.fine}")
+
+
+
+def _integer_id(value):
+    """Returns value as an int if it is a plain whole-number ID, else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit() and str(int(value)) == value:
+        return int(value)
+    return None
+
+
+class TransactionTable:
+    """The Transactions ledger held column by column instead of row by row.
+
+    IDs are kept in integer arrays, dates as day ordinals (NO_DATE when
+    missing) and fines as floats, a few dozen bytes per transaction
+    against several hundred for a row of openpyxl Cells. The odd value
+    that does not fit its column (a non-numeric ID, an unreadable date)
+    is kept as-is on the side, so row() gives back what was stored.
+    IDs typed as digits come back as ints.
+    """
+
+    COLUMNS = ("ids", "member_ids", "book_ids", "issued", "returned")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.member_ids = array("q")
+        self.book_ids = array("q")
+        self.issued = array("i")        # IssueDate ordinals
+        self.returned = array("i")      # ReturnDate ordinals, NO_DATE while open
+        self.fines = array("d")
+        self._raw = {}                  # (column, position) -> value that did not fit
+        self._ordinal_cache = {}
+
+    @classmethod
+    def load(cls, storage):
+        """Streams the Transactions sheet/table into a new TransactionTable."""
+        table = cls()
+        for row in storage.stream_rows("Transactions"):
+            table.append(row)
+        table._ordinal_cache = {}
+        return table
+
+    def _ordinal(self, value):
+        # Ledgers repeat the same few thousand dates; parse each only once
+        try:
+            return self._ordinal_cache[value]
+        except KeyError:
+            parsed = parse_date(value)
+            ordinal = parsed.toordinal() if parsed is not None else NO_DATE
+            self._ordinal_cache[value] = ordinal
+            return ordinal
+        except TypeError:
+            parsed = parse_date(value)
+            return parsed.toordinal() if parsed is not None else NO_DATE
+
+    def append(self, row):
+        """Adds one Transactions row (TransactionID, MemberID, BookID, IssueDate, ReturnDate, Fine)."""
+        position = len(self.ids)
+        for column, value in zip(("ids", "member_ids", "book_ids"), row[:3]):
+            number = _integer_id(value)
+            if number is None:
+                self._raw[(column, position)] = value
+                number = NO_ID
+            getattr(self, column).append(number)
+        for column, value in (("issued", row[3]), ("returned", row[4])):
+            ordinal = self._ordinal(value)
+            if ordinal == NO_DATE and value is not None and value != "":
+                self._raw[(column, position)] = value
+            getattr(self, column).append(ordinal)
+        fine = row[5]
+        self.fines.append(fine if isinstance(fine, (int, float)) and not isinstance(fine, bool) else 0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _value(self, column, position):
+        raw = self._raw.get((column, position))
+        if raw is not None:
+            return raw
+        value = getattr(self, column)[position]
+        return None if value == NO_ID else value
+
+    def key(self, position):
+        """TransactionID of a row as stored, for storage.update_row and friends."""
+        return self._value("ids", position)
+
+    def member_id(self, position):
+        return self._value("member_ids", position)
+
+    def book_id(self, position):
+        return self._value("book_ids", position)
+
+    def fine(self, position):
+        fine = self.fines[position]
+        return int(fine) if fine.is_integer() else fine
+
+    def is_open(self, position):
+        return self.returned[position] == NO_DATE and ("returned", position) not in self._raw
+
+    def _date(self, column, position):
+        raw = self._raw.get((column, position))
+        if raw is not None:
+            return raw
+        ordinal = getattr(self, column)[position]
+        return "" if ordinal == NO_DATE else date.fromordinal(ordinal).strftime(DATE_FORMAT)
+
+    def row(self, position):
+        """Returns one transaction shaped like a storage row."""
+        return (self.key(position), self.member_id(position), self.book_id(position),
+                self._date("issued", position), self._date("returned", position), self.fine(position))
+
+    def rows(self):
+        for position in range(len(self)):
+            yield self.row(position)
+
+    def transaction(self, position):
+        return Transaction.from_row(self.row(position))
+
+    def open_positions(self):
+        """Positions of every open (unreturned) transaction."""
+        return [i for i, ret in enumerate(self.returned) if ret == NO_DATE and ("returned", i) not in self._raw]
+
+    def open_counts(self, column="member_ids"):
+        """Returns {str(ID): open loans} per member (or per book with column="book_ids")."""
+        counts = {}
+        for position in self.open_positions():
+            key = str(self._value(column, position))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def total_fine(self):
+        total = math.fsum(self.fines)
+        return int(total) if total.is_integer() else total
+
+    def nbytes(self):
+        """Approximate memory held by the columns, in bytes."""
+        return sum(getattr(self, column).itemsize * len(self) for column in self.COLUMNS) + \
+            self.fines.itemsize * len(self)
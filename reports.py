@@ -1,5 +1,11 @@
 # reports.py
-from datetime import datetime
+from datetime import date, timedelta
+from models import DATE_FORMAT, parse_date
+from archive import TransactionArchiver
+from aggregates import ReportAggregates
+from fine_engine import FineEngine
+from storage import StaleWorkbookError
+from filelock import LockTimeout
 
 class ReportGenerator:
     def __init__(self, storage):
@@ -7,61 +13,57 @@ class ReportGenerator:
         self.trans_sheet = "Transactions"
         self.due_days = 7
         self.fine_per_day = 10
+        self.archiver = TransactionArchiver(storage)
+        self.aggregates = ReportAggregates(storage)
 
     def view_active_issues(self):
         """Shows a list of all books that are currently issued."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.trans_sheet)
-
         print("\nACTIVE ISSUED BOOKS\n")
         found = False
-        count = 0
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
+        for row in self.storage.get_open_transactions():
             trans_id, mem_id, book_id, issue_date, return_date, fine = row
-            if return_date is None or return_date == "":
-                print(f"Trans ID: {trans_id} | Member: {mem_id} | Book: {book_id} | Issued: {issue_date}")
-                found = True
-                count += 1
+            print(f"Trans ID: {trans_id} | Member: {mem_id} | Book: {book_id} | Issued: {issue_date}")
+            found = True
 
         if not found:
             print("[INFO] No active issued books found (All returned).")
         else:
-            print(f"\nTotal Books Currently Issued: {count}")
+            print(f"\nTotal Books Currently Issued: {self.aggregates.active_loans()}")
         print()
 
+    def overdue_loans(self, today=None):
+        """Returns (transaction row, days late, estimated fine) for every overdue loan."""
+        today = today or date.today()
+        loans = []
+        # Only loans issued more than due_days ago are late
+        late_cutoff = today - timedelta(days=self.due_days)
+        for row in self.storage.get_open_transactions_issued_between(end=late_cutoff):
+            days_passed = (today - parse_date(row[3])).days
+            extra_days = days_passed - self.due_days
+            loans.append((row, extra_days, extra_days * self.fine_per_day))
+        return loans
+
+    def due_soon_loans(self, days, today=None):
+        """Returns (transaction row, due date) for loans falling due within days."""
+        today = today or date.today()
+        # Due date = issue date + due_days, so due in [today, today + days]
+        # means issued in [today - due_days, today - due_days + days].
+        start = today - timedelta(days=self.due_days)
+        end = start + timedelta(days=days + 1)
+        return [(row, parse_date(row[3]) + timedelta(days=self.due_days))
+                for row in self.storage.get_open_transactions_issued_between(start, end)]
+
     def view_overdue_books(self):
         """Shows books that have exceeded the due limit and are still with the member."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.trans_sheet)
-
         print("\nOVERDUE (LATE) BOOKS\n")
         found = False
-        today = datetime.today()
         total_estimated_fine = 0
 
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            trans_id, mem_id, book_id, issue_date_raw, return_date, fine = row
-
-            if return_date is None or return_date == "":
-                try:
-                    if isinstance(issue_date_raw, datetime):
-                        issue_date = issue_date_raw
-                    elif isinstance(issue_date_raw, str):
-                        issue_date = datetime.strptime(issue_date_raw, "%Y-%m-%d")
-                    else:
-                        continue
-                    
-                    days_passed = (today - issue_date).days
-                    if days_passed > self.due_days:
-                        extra_days = days_passed - self.due_days
-                        estimated_fine = extra_days * self.fine_per_day
-                        total_estimated_fine += estimated_fine
-                        print(f"LATE! Member: {mem_id} | Book: {book_id} | Days Late: {extra_days} | Est. Fine: ₹{estimated_fine}")
-                        found = True
-                except ValueError:
-                    continue
+        for row, extra_days, estimated_fine in self.overdue_loans():
+            trans_id, mem_id, book_id, issue_date, return_date, fine = row
+            total_estimated_fine += estimated_fine
+            print(f"LATE! Member: {mem_id} | Book: {book_id} | Days Late: {extra_days} | Est. Fine: ₹{estimated_fine}")
+            found = True
 
         if not found:
             print("No overdue books found.")
@@ -69,30 +71,108 @@ class ReportGenerator:
             print(f"Total Estimated Fine: ₹{total_estimated_fine}")
         print()
 
-    def view_total_fine(self):
-        """Calculates the total fine collected from returned books."""
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.trans_sheet)
+    def view_due_soon(self):
+        """Shows books that fall due within the next N days."""
+        days = input("Show books due within how many days? [3]: ").strip()
+        try:
+            days = int(days) if days else 3
+        except ValueError:
+            print("\n[ERROR] Please enter a number of days.\n")
+            return
+
+        print(f"\nBOOKS DUE IN THE NEXT {days} DAY(S)\n")
+        found = False
+        for row, due_date in self.due_soon_loans(days):
+            trans_id, mem_id, book_id, issue_date, return_date, fine = row
+            print(f"Trans ID: {trans_id} | Member: {mem_id} | Book: {book_id} | Due: {due_date.strftime(DATE_FORMAT)}")
+            found = True
+
+        if not found:
+            print("[INFO] No books fall due in that period.")
+        print()
+
+    def view_total_fine(self, include_archive=False):
+        """Calculates the total fine collected from returned books.
+
+        With include_archive, transactions moved to the yearly archive
+        files are added to the total as well.
+        """
+        total_fine = self.aggregates.total_fine()
 
-        total_fine = 0
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not any(row): continue
-            fine = row[5]
-            if fine is not None and isinstance(fine, (int, float)):
-                total_fine += fine
+        archived_fine = 0
+        if include_archive:
+            for row in self.archiver.iter_archived_rows():
+                fine = row[5]
+                if fine is not None and isinstance(fine, (int, float)):
+                    archived_fine += fine
 
         print(f"\nTOTAL FINE COLLECTED")
+        if include_archive:
+            print(f"Live Transactions: ₹{total_fine}")
+            print(f"Archived: ₹{archived_fine}")
+            total_fine += archived_fine
         print(f"Total Amount: ₹{total_fine}")
         print("------------------------------\n")
 
+    def view_fine_summary(self):
+        """Prices every transaction in one batched pass and shows the totals."""
+        summary = FineEngine(self.fine_per_day, self.due_days).summary(self.storage)
+        print("\nFINE SUMMARY (WHOLE LEDGER)")
+        print(f"Transactions: {summary['transactions']}")
+        print(f"Fines on Returned Books: ₹{summary['returned_fines']}")
+        print(f"Overdue Books: {summary['overdue_loans']} | Est. Fine: ₹{summary['overdue_fines']}")
+        print(f"Most Days Late: {summary['max_days_late']}")
+        print("------------------------------\n")
+
+    def reprice_fines(self):
+        """Recomputes stored fines of returned books with the current fine rules."""
+        try:
+            engine = FineEngine(self.fine_per_day, self.due_days)
+            changed, delta = self.storage.run_with_retry(lambda: engine.reprice(self.storage, commit=False))
+        except PermissionError:
+            print("\n[ERROR] Close the Excel file 'library.xlsx' and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
+        if not changed:
+            print("\n[INFO] All stored fines already match the current rules.\n")
+            return
+        print(f"\n[SUCCESS] Re-priced {changed} transaction(s). Total fine changed by ₹{delta}\n")
+
+    def verify_aggregates(self):
+        """Recomputes the stored report totals from raw rows and fixes any drift."""
+        drift = self.aggregates.verify()
+        if not drift:
+            print("\n[INFO] Report totals match the transactions.\n")
+            return
+
+        print("\nDrift found:")
+        for name, stored, actual in drift:
+            print(f" - {name}: stored {stored}, actual {actual}")
+        try:
+            self.storage.run_with_retry(lambda: self.aggregates.rebuild(commit=False))
+        except PermissionError:
+            print("\n[ERROR] Close the Excel file 'library.xlsx' and try again!\n")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}\n")
+            return
+        print("\n[SUCCESS] Report totals rebuilt.\n")
+
     def reports_menu(self):
         """Displays the Reports menu."""
         while True:
             print("REPORTS MENU")
             print("1. View Active Issues (Books with members)")
             print("2. View Overdue Books (Late list)")
-            print("3. View Total Fine Collected")
-            print("4. Back to Main Menu")
+            print("3. View Books Due Soon")
+            print("4. View Total Fine Collected")
+            print("5. View Total Fine Collected (incl. Archive)")
+            print("6. Verify/Rebuild Report Totals")
+            print("7. View Fine Summary (Whole Ledger)")
+            print("8. Re-price Fines with Current Rules")
+            print("9. Back to Main Menu")
 
             choice = input("Enter choice: ")
             if choice == "1":
@@ -100,8 +180,18 @@ class ReportGenerator:
             elif choice == "2":
                 self.view_overdue_books()
             elif choice == "3":
-                self.view_total_fine()
+                self.view_due_soon()
             elif choice == "4":
+                self.view_total_fine()
+            elif choice == "5":
+                self.view_total_fine(include_archive=True)
+            elif choice == "6":
+                self.verify_aggregates()
+            elif choice == "7":
+                self.view_fine_summary()
+            elif choice == "8":
+                self.reprice_fines()
+            elif choice == "9":
                 break
             else:
                 print("\n Invalid choice. Try again.\n")
\ No newline at end of file
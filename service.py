@@ -0,0 +1,481 @@
+# service.py
+# ------------------------------------------------------------
+# Local HTTP/JSON service for several circulation desks.
+#
+# One process owns library.xlsx (or library.db) and the desks talk to
+# it over HTTP instead of each loading and saving the file:
+#   - Reads are answered straight from the storage's in-memory
+#     snapshot, interleaved with any number of other requests.
+#   - Every change goes through a single writer task. Changes that
+#     arrive together are applied one after another and saved with one
+#     commit (group commit), so readers only ever see saved data.
+#   - The slow jobs run on a worker thread, so the event loop keeps
+#     answering reads meanwhile: the full library.xlsx rewrite
+#     (checkpoint) after every CHECKPOINT_EVERY journal records, which
+#     builds its own copy of the data from disk, and whole-ledger
+#     reports, which read a snapshot of the data. New changes wait in
+#     the queue until such a job is done.
+#
+# Usage:
+#   python service.py [--host 127.0.0.1] [--port 8765]
+#
+# Every endpoint except /login needs "Authorization: Bearer <token>"
+# with a token from POST /login {"username", "password"}; tokens expire
+# after login.SESSION_TTL seconds.
+#
+# Endpoints (JSON in, JSON out):
+#   POST   /login                  POST   /logout
+#   GET    /books[?q=words]        GET    /books/<id>
+#   POST   /books                  DELETE /books/<id>
+#   GET    /members                GET    /members/<id>
+#   POST   /members                DELETE /members/<id>
+#   GET    /loans                  (open transactions)
+#   POST   /issue   {"member_id", "book_id"} or {"items": [[m, b], ...], "atomic": false}
+#   POST   /return  same as /issue
+#   GET    /reports/overdue        GET    /reports/due-soon?days=3
+#   GET    /reports/fines          GET    /reports/fine-summary
+# ------------------------------------------------------------
+
+import re
+import sys
+import json
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+
+from storage import create_storage, StaleWorkbookError, STALE_RETRIES
+from aggregates import ReportAggregates
+from books import BookManager
+from members import MemberManager
+from transactions import TransactionManager, BatchRejected
+from reports import ReportGenerator
+from fine_engine import FineEngine
+from login import AuthManager
+import instrumentation
+
+# -------- CONFIGURATION --------
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+# How long the writer waits for more changes to join a group commit (seconds)
+GROUP_COMMIT_WINDOW = 0.005
+# Most changes saved by one commit
+GROUP_COMMIT_MAX = 200
+
+# Largest request body accepted (bytes)
+MAX_BODY = 1024 * 1024
+
+# Require a session token from /login on every other endpoint
+REQUIRE_LOGIN = True
+# -------------------------------
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """A request that cannot be served; carries the HTTP status.
+
+    Raised before anything was changed unless rollback is True.
+    """
+
+    def __init__(self, status, message, payload=None, rollback=False):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload if payload is not None else {"error": message}
+        self.rollback = rollback
+
+
+class LibraryService:
+    def __init__(self, storage=None, auth=None):
+        self.storage = storage or create_storage()
+        # Checkpoints are run by the writer task, off the event loop
+        self.storage.background_checkpoints = True
+        self.auth = auth or AuthManager()
+        self.book_manager = BookManager(self.storage)
+        self.member_manager = MemberManager(self.storage)
+        self.transaction_manager = TransactionManager(self.storage)
+        self.report_generator = ReportGenerator(self.storage)
+        self.queue = None
+        # Held by the writer while it changes data and by worker-thread
+        # reads while they use a snapshot of it
+        self.write_gate = None
+        self.stats = {"requests": 0, "writes": 0, "commits": 0, "checkpoints": 0}
+        # (method, path pattern, handler, goes through the writer)
+        self.routes = [
+            ("POST", r"/login", self.login, False),
+            ("POST", r"/logout", self.logout, False),
+            ("GET", r"/books", self.list_books, False),
+            ("GET", r"/books/(?P<key>[^/]+)", self.get_book, False),
+            ("POST", r"/books", self.add_book, True),
+            ("DELETE", r"/books/(?P<key>[^/]+)", self.delete_book, True),
+            ("GET", r"/members", self.list_members, False),
+            ("GET", r"/members/(?P<key>[^/]+)", self.get_member, False),
+            ("POST", r"/members", self.add_member, True),
+            ("DELETE", r"/members/(?P<key>[^/]+)", self.delete_member, True),
+            ("GET", r"/loans", self.list_loans, False),
+            ("POST", r"/issue", self.issue, True),
+            ("POST", r"/return", self.return_books, True),
+            ("GET", r"/reports/overdue", self.overdue, False),
+            ("GET", r"/reports/due-soon", self.due_soon, False),
+            ("GET", r"/reports/fines", self.fines, False),
+            ("GET", r"/reports/fine-summary", self.fine_summary, False),
+            ("GET", r"/stats", self.get_stats, False),
+        ]
+
+    def _record(self, sheet_name, row):
+        return dict(zip(self.storage.required_sheets[sheet_name], row))
+
+    # -------- SESSIONS --------
+    async def login(self, params, body):
+        # PBKDF2 takes a noticeable fraction of a second; keep it off the event loop
+        token, role = await asyncio.get_running_loop().run_in_executor(
+            None, self.auth.login, _text_field(body, "username"), str(body.get("password", "")))
+        if token is None:
+            raise RequestError(401, "Invalid credentials.")
+        return 200, {"token": token, "role": role, "expires_in": self.auth.session_ttl}
+
+    def logout(self, params, body):
+        self.auth.logout(params.get("token"))
+        return 200, {"logged_out": True}
+
+    def _authorize(self, headers):
+        """Returns the session token from the request, or raises 401."""
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or self.auth.check_token(token.strip()) is None:
+            raise RequestError(401, "Log in first (POST /login) and send 'Authorization: Bearer <token>'.")
+        return token.strip()
+
+    # -------- READS (served from the in-memory snapshot) --------
+    def list_books(self, params, body):
+        query = params.get("q", "").strip()
+        rows = self.book_manager.find_books(query) if query else self.storage.get_rows("Books")
+        return 200, [self._record("Books", row) for row in rows]
+
+    def get_book(self, params, body):
+        row = self.storage.get_row("Books", params["key"])
+        if row is None:
+            raise RequestError(404, f"Book ID {params['key']} not found!")
+        return 200, self._record("Books", row)
+
+    def list_members(self, params, body):
+        return 200, [self._record("Members", row) for row in self.storage.get_rows("Members")]
+
+    def get_member(self, params, body):
+        row = self.storage.get_row("Members", params["key"])
+        if row is None:
+            raise RequestError(404, f"Member ID {params['key']} not found!")
+        return 200, self._record("Members", row)
+
+    def list_loans(self, params, body):
+        return 200, [self._record("Transactions", row) for row in self.storage.get_open_transactions()]
+
+    def overdue(self, params, body):
+        return 200, [dict(self._record("Transactions", row), DaysLate=days, EstimatedFine=fine)
+                     for row, days, fine in self.report_generator.overdue_loans()]
+
+    def due_soon(self, params, body):
+        days = _int_param(params, "days", 3)
+        return 200, [dict(self._record("Transactions", row), DueDate=due_date)
+                     for row, due_date in self.report_generator.due_soon_loans(days)]
+
+    async def fines(self, params, body):
+        totals = self.report_generator.aggregates.stored_totals()
+        if totals is not None:
+            return 200, {"total_fine": totals[0], "active_loans": totals[1]}
+        # Not stored yet: worked out from the whole ledger
+        total_fine, active_loans, _ = await self.read_off_loop(lambda reader: ReportAggregates(reader).compute())
+        return 200, {"total_fine": total_fine, "active_loans": active_loans}
+
+    async def fine_summary(self, params, body):
+        engine = FineEngine(self.report_generator.fine_per_day, self.report_generator.due_days)
+        return 200, await self.read_off_loop(engine.summary)
+
+    async def read_off_loop(self, fn):
+        """Runs fn(reader) on a worker thread over a snapshot of the data.
+
+        Changes wait until it is done; other reads carry on.
+        """
+        async with self.write_gate:
+            reader = self.storage.snapshot_reader()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(None, fn, reader)
+            finally:
+                reader.close()
+
+    def get_stats(self, params, body):
+        return 200, dict(self.stats, queued=self.queue.qsize() if self.queue else 0)
+
+    # -------- WRITES (run by the writer task, saved by group commit) --------
+    def add_book(self, params, body):
+        title = _text_field(body, "title")
+        try:
+            quantity = int(body.get("quantity", 0))
+        except (TypeError, ValueError):
+            raise RequestError(400, "Invalid input. Please enter a number for Quantity.")
+        book_id = self.book_manager.create_book(title, str(body.get("author", "")), quantity)
+        return 201, {"book_id": book_id}
+
+    def delete_book(self, params, body):
+        if not self.book_manager.remove_book(params["key"]):
+            raise RequestError(404, "Book not found.")
+        return 200, {"deleted": params["key"]}
+
+    def add_member(self, params, body):
+        member_id = self.member_manager.create_member(_text_field(body, "name"), str(body.get("phone", "")))
+        return 201, {"member_id": member_id}
+
+    def delete_member(self, params, body):
+        error = self.member_manager.remove_member(params["key"])
+        if error:
+            exists = self.storage.get_row("Members", params["key"]) is not None
+            raise RequestError(409 if exists else 404, error)
+        return 200, {"deleted": params["key"]}
+
+    def _loan_batch(self, body, run):
+        if "items" in body:
+            items = body["items"]
+            if not isinstance(items, list) or not all(isinstance(item, (list, tuple)) and len(item) == 2
+                                                      for item in items):
+                raise RequestError(400, "items must be a list of [member_id, book_id] pairs.")
+        else:
+            items = [(_text_field(body, "member_id"), _text_field(body, "book_id"))]
+        # Items are applied without saving; the writer's group commit saves
+        # them, or rolls back a rejected atomic batch on its own.
+        try:
+            results = run(items, atomic=bool(body.get("atomic")), commit=False)
+        except BatchRejected as e:
+            raise RequestError(409, str(e), e.results, rollback=True)
+        return (200 if any(item["ok"] for item in results) or not results else 409), results
+
+    def issue(self, params, body):
+        return self._loan_batch(body, self.transaction_manager.issue_books)
+
+    def return_books(self, params, body):
+        return self._loan_batch(body, self.transaction_manager.return_books)
+
+    # -------- WRITER TASK --------
+    async def submit(self, handler, params, body):
+        """Queues a change for the writer and waits until it has been saved."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((handler, params, body, future))
+        return await future
+
+    def _apply_group(self, group, attempt=0):
+        """Applies a group of changes and saves them with one commit.
+
+        A change that raises after touching the data is rolled back on
+        its own: the others are re-applied without it, so one bad request
+        never loses the rest.
+        """
+        pending, results = list(group), []
+        while pending:
+            self.storage.begin()
+            results, failed = [], None
+            for item in pending:
+                handler, params, body, future = item
+                try:
+                    results.append((future, handler(params, body)))
+                except RequestError as e:
+                    future.set_exception(e)
+                    if e.rollback:
+                        failed = item
+                        break
+                except Exception as e:
+                    future.set_exception(e)
+                    failed = item
+                    break
+            if failed is None:
+                break
+            self.storage.rollback()
+            pending = [item for item in pending if item is not failed and not item[3].done()]
+        if not results:
+            # Every item was refused; close the transaction (and SQLite's write lock)
+            self.storage.rollback()
+            return
+
+        try:
+            self.storage.commit()
+        except StaleWorkbookError as e:
+            # Someone outside the service saved first: apply the group again on fresh data
+            if attempt < STALE_RETRIES:
+                return self._apply_group([item for item in group if not item[3].done()], attempt + 1)
+            for future, _ in results:
+                future.set_exception(e)
+            return
+        except Exception as e:
+            self.storage.rollback()
+            for future, _ in results:
+                future.set_exception(e)
+            return
+        self.stats["commits"] += 1
+        self.stats["writes"] += len(results)
+        for future, result in results:
+            future.set_result(result)
+
+    async def writer(self):
+        """Single writer: drains queued changes into group commits, forever."""
+        while True:
+            group = [await self.queue.get()]
+            if GROUP_COMMIT_WINDOW:
+                await asyncio.sleep(GROUP_COMMIT_WINDOW)
+            while len(group) < GROUP_COMMIT_MAX and not self.queue.empty():
+                group.append(self.queue.get_nowait())
+            async with self.write_gate:
+                # Nothing awaits between applying and committing, so readers
+                # never see a half-applied group.
+                try:
+                    self._apply_group(group)
+                except Exception as e:
+                    # e.g. the rollback itself failed; the writer must keep running
+                    for _, _, _, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+                await self.checkpoint()
+
+    async def checkpoint(self):
+        """Rewrites library.xlsx on a worker thread once enough journal records built up.
+
+        Only called by the writer, so no change is made while the file
+        is being written. The worker thread saves a workbook of its own,
+        never the one requests are reading.
+        """
+        handle = self.storage.begin_checkpoint()
+        if handle is None:
+            return
+        future = asyncio.get_running_loop().run_in_executor(None, self.storage.write_checkpoint, handle)
+        written = False
+        try:
+            await asyncio.shield(future)
+            written = True
+        except asyncio.CancelledError:
+            # The service is stopping; let the write finish so close() finds a settled file
+            await asyncio.wait([future])
+            written = future.exception() is None
+            raise
+        except Exception as e:
+            # The journal still holds every change; the next commit tries again
+            print(f"[ERROR] Checkpoint failed: {e}")
+        finally:
+            if self.storage.end_checkpoint(handle, written):
+                self.stats["checkpoints"] += 1
+
+    # -------- HTTP --------
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, handler, is_write in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                if route_method == method:
+                    return handler, is_write, match.groupdict()
+                allowed = True
+        raise RequestError(405 if allowed else 404, f"No route for {method} {path}")
+
+    async def dispatch(self, method, target, body, headers=None):
+        """Runs one request and returns (status, JSON-ready payload)."""
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        handler, is_write, path_params = self._route(method, url.path.rstrip("/") or "/")
+        params.update(path_params)
+        if handler != self.login and REQUIRE_LOGIN:
+            params["token"] = self._authorize(headers or {})
+        if is_write or handler == self.login:
+            if not isinstance(body, dict):
+                raise RequestError(400, "Expected a JSON object.")
+        if is_write:
+            return await self.submit(handler, params, body)
+        result = handler(params, body)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def handle_connection(self, reader, writer):
+        """Serves one HTTP/1.1 request per connection."""
+        self.stats["requests"] += 1
+        try:
+            status, payload = await self._read_and_dispatch(reader)
+        except RequestError as e:
+            status, payload = e.status, e.payload
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        data = json.dumps(payload, default=str).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode("ascii") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_and_dispatch(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise RequestError(400, "Malformed request.")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise RequestError(400, "Malformed request line.")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY:
+            raise RequestError(413, "Request body too large.")
+        body = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except (asyncio.IncompleteReadError, ValueError):
+                raise RequestError(400, "Body is not valid JSON.")
+        return await self.dispatch(method.upper(), target, body, headers)
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Runs the service until cancelled, then folds outstanding changes into the file."""
+        self.queue = asyncio.Queue()
+        self.write_gate = asyncio.Lock()
+        writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"[INFO] Library service listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            # A checkpoint in flight finishes (or is dropped) before close() writes the file
+            async with self.write_gate:
+                self.storage.close()
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise RequestError(400, f"{name} must be a number.")
+
+
+def _text_field(body, name):
+    value = str(body.get(name, "") or "").strip()
+    if not value:
+        raise RequestError(400, f"Missing {name}.")
+    return value
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    host = args[args.index("--host") + 1] if "--host" in args else SERVICE_HOST
+    port = int(args[args.index("--port") + 1]) if "--port" in args else SERVICE_PORT
+    instrumentation.install()
+    try:
+        asyncio.run(LibraryService().serve(host, port))
+    except KeyboardInterrupt:
+        print("\n[INFO] Library service stopped.")
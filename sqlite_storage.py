@@ -0,0 +1,509 @@
+# sqlite_storage.py
+# ------------------------------------------------------------
+# SQLite storage engine for the Library Management System.
+#
+# Responsibilities:
+#   - Keep Books, Members and Transactions in library.db with the
+#     same columns as the Excel sheets in storage.py
+#   - Offer the same record-level API as LibraryStorage so the
+#     managers work unchanged on either backend
+#   - Migrate an existing library.xlsx into SQLite and export the
+#     data back to an .xlsx spreadsheet
+#
+# Usage:
+#   python sqlite_storage.py migrate [library.xlsx] [library.db]
+#   python sqlite_storage.py export [library.db] [library.xlsx]
+# ------------------------------------------------------------
+
+import os
+import sqlite3
+import sys
+
+from storage import REQUIRED_SHEETS, LIBRARY_FILE, SQLITE_FILE, COMPACT_THRESHOLD, STALE_RETRIES
+from models import DATE_FORMAT, parse_date
+from filelock import LockTimeout
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS Books (
+        BookID INTEGER PRIMARY KEY,
+        Title TEXT,
+        Author TEXT,
+        Quantity INTEGER,
+        Issued INTEGER DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS Members (
+        MemberID INTEGER PRIMARY KEY,
+        Name TEXT,
+        Phone TEXT,
+        BooksIssued INTEGER DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS Transactions (
+        TransactionID INTEGER PRIMARY KEY,
+        MemberID INTEGER,
+        BookID INTEGER,
+        IssueDate TEXT,
+        ReturnDate TEXT,
+        Fine INTEGER DEFAULT 0
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_transactions_open
+        ON Transactions (MemberID, BookID, ReturnDate)""",
+    """CREATE INDEX IF NOT EXISTS idx_transactions_due
+        ON Transactions (ReturnDate, IssueDate)""",
+    """CREATE TABLE IF NOT EXISTS Meta (
+        Key TEXT PRIMARY KEY,
+        Value
+    )""",
+    """CREATE TABLE IF NOT EXISTS Sequences (
+        Name TEXT PRIMARY KEY,
+        Value INTEGER
+    )""",
+]
+
+# Meta keys that migrate_from_xlsx leaves behind
+XLSX_ONLY_META = ("JournalSeq", "CheckpointSeq")
+
+
+class SQLiteStorage:
+    def __init__(self, filename=SQLITE_FILE):
+        self.filename = filename
+        self.required_sheets = {name: list(headers) for name, headers in REQUIRED_SHEETS.items()}
+        self.conn = sqlite3.connect(filename)
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.upgrade_books_table()
+        self.conn.commit()
+
+    def upgrade_books_table(self):
+        """Adds the Issued column to a Books table created before it existed."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(Books)")]
+        if "Issued" in columns:
+            return
+        self.conn.execute("ALTER TABLE Books ADD COLUMN Issued INTEGER DEFAULT 0")
+        self.conn.execute(
+            "UPDATE Books SET Issued = (SELECT COUNT(*) FROM Transactions t "
+            "WHERE t.BookID = Books.BookID AND t.ReturnDate IS NULL)"
+        )
+
+    def _key_column(self, sheet_name):
+        return self.required_sheets[sheet_name][0]
+
+    def _check_columns(self, sheet_name, headers):
+        for header in headers:
+            if header not in self.required_sheets[sheet_name]:
+                raise ValueError(f"Unknown column {header!r} for {sheet_name}")
+
+    def _normalize(self, sheet_name, header, value):
+        # Open loans are stored as NULL so the (MemberID, BookID, ReturnDate)
+        # index can answer "still issued" lookups directly.
+        if sheet_name == "Transactions" and header == "ReturnDate" and value == "":
+            return None
+        # Dates are kept as 'YYYY-MM-DD' text; Excel hands datetime cells
+        # over as datetimes, which sqlite3 would store with a time part.
+        if sheet_name == "Transactions" and header in ("IssueDate", "ReturnDate") and parse_date(value) is not None:
+            return parse_date(value).strftime(DATE_FORMAT)
+        return value
+
+    # -------- RECORD API (shared with LibraryStorage) --------
+    def get_rows(self, sheet_name):
+        """Yields every row of a table as a tuple, ordered by ID."""
+        key = self._key_column(sheet_name)
+        yield from self.conn.execute(f"SELECT * FROM {sheet_name} ORDER BY {key}")
+
+    def stream_rows(self, sheet_name):
+        """Yields every row of a table; SQLite cursors already stream."""
+        return self.get_rows(sheet_name)
+
+    def get_row(self, sheet_name, key):
+        """Returns the row with the given ID, or None."""
+        column = self._key_column(sheet_name)
+        return self.conn.execute(
+            f"SELECT * FROM {sheet_name} WHERE {column} = ?", (key,)
+        ).fetchone()
+
+    def add_row(self, sheet_name, values):
+        """Inserts a new row."""
+        headers = self.required_sheets[sheet_name]
+        values = [self._normalize(sheet_name, h, v) for h, v in zip(headers, values)]
+        placeholders = ", ".join("?" for _ in values)
+        self.conn.execute(
+            f"INSERT INTO {sheet_name} ({', '.join(headers[:len(values)])}) VALUES ({placeholders})",
+            values
+        )
+
+    def add_rows(self, sheet_name, rows):
+        """Inserts many rows at once."""
+        headers = self.required_sheets[sheet_name]
+        placeholders = ", ".join("?" for _ in headers)
+        self.conn.executemany(
+            f"INSERT INTO {sheet_name} ({', '.join(headers)}) VALUES ({placeholders})",
+            ([self._normalize(sheet_name, h, v) for h, v in zip(headers, values)] for values in rows)
+        )
+
+    def update_row(self, sheet_name, key, changes):
+        """Updates the named columns of the row with the given ID.
+
+        Returns False if no such row exists.
+        """
+        self._check_columns(sheet_name, changes)
+        assignments = ", ".join(f"{header} = ?" for header in changes)
+        values = [self._normalize(sheet_name, h, v) for h, v in changes.items()]
+        cursor = self.conn.execute(
+            f"UPDATE {sheet_name} SET {assignments} WHERE {self._key_column(sheet_name)} = ?",
+            values + [key]
+        )
+        return cursor.rowcount > 0
+
+    def delete_row(self, sheet_name, key):
+        """Deletes the row with the given ID. Returns False if not found."""
+        cursor = self.conn.execute(
+            f"DELETE FROM {sheet_name} WHERE {self._key_column(sheet_name)} = ?", (key,)
+        )
+        return cursor.rowcount > 0
+
+    def delete_rows(self, sheet_name, keys):
+        """Deletes every row whose ID is in keys. Returns the number deleted."""
+        cursor = self.conn.executemany(
+            f"DELETE FROM {sheet_name} WHERE {self._key_column(sheet_name)} = ?",
+            ((key,) for key in keys)
+        )
+        return cursor.rowcount
+
+    def tombstone_stats(self, threshold=COMPACT_THRESHOLD):
+        """Returns {"pages": (free pages, total pages)} once the free share reaches threshold.
+
+        SQLite deletes rows outright; what is left behind are free pages
+        in library.db, which compact() reclaims.
+        """
+        free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        if free > 0 and free >= threshold * total:
+            return {"pages": (free, total)}
+        return {}
+
+    def compact(self, threshold=COMPACT_THRESHOLD):
+        """Commits and VACUUMs library.db once the free share reaches threshold.
+
+        Returns {"pages": free pages reclaimed}.
+        """
+        stats = self.tombstone_stats(threshold)
+        if not stats:
+            return {}
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        return {name: free for name, (free, _) in stats.items()}
+
+    def allocate_ids(self, sheet_name, count=1, start=1):
+        """Reserves count consecutive IDs for a table and returns the first.
+
+        Counters live in the Sequences table and are bumped inside the
+        current transaction: SQLite's write lock keeps two processes from
+        getting the same ID, and a rollback hands the IDs back. The first
+        allocation for a table starts after its highest ID; no ID below
+        start is ever returned.
+        """
+        key_column = self._key_column(sheet_name)
+        self.conn.execute(
+            f"INSERT OR IGNORE INTO Sequences (Name, Value) "
+            f"SELECT ?, COALESCE(MAX({key_column}), 0) FROM {sheet_name}", (sheet_name,)
+        )
+        self.conn.execute(
+            "UPDATE Sequences SET Value = MAX(Value + 1, ?) + ? - 1 WHERE Name = ?",
+            (start, count, sheet_name)
+        )
+        last = self.conn.execute("SELECT Value FROM Sequences WHERE Name = ?", (sheet_name,)).fetchone()[0]
+        return last - count + 1
+
+    def last_id(self, sheet_name):
+        """Returns the highest ID in a table, or None if it is empty."""
+        column = self._key_column(sheet_name)
+        return self.conn.execute(f"SELECT MAX({column}) FROM {sheet_name}").fetchone()[0]
+
+    def find_open_transaction(self, member_id, book_id):
+        """Returns the open (unreturned) transaction for a member/book pair, or None."""
+        return self.conn.execute(
+            "SELECT * FROM Transactions WHERE MemberID = ? AND BookID = ? AND ReturnDate IS NULL "
+            "ORDER BY TransactionID LIMIT 1",
+            (member_id, book_id)
+        ).fetchone()
+
+    def has_open_transactions(self, member_id):
+        """Returns True if the member still has a book issued."""
+        row = self.conn.execute(
+            "SELECT 1 FROM Transactions WHERE MemberID = ? AND ReturnDate IS NULL LIMIT 1",
+            (member_id,)
+        ).fetchone()
+        return row is not None
+
+    def get_open_transactions(self):
+        """Returns every open (unreturned) transaction, oldest first."""
+        return self.conn.execute(
+            "SELECT * FROM Transactions WHERE ReturnDate IS NULL ORDER BY TransactionID"
+        ).fetchall()
+
+    def get_open_transactions_issued_between(self, start=None, end=None):
+        """Returns open transactions issued on or after start and before end, oldest first.
+
+        start and end are dates (either may be None). Served by the
+        (ReturnDate, IssueDate) index, since 'YYYY-MM-DD' text sorts by date.
+        """
+        query = "SELECT * FROM Transactions WHERE ReturnDate IS NULL"
+        params = []
+        if start is not None:
+            query += " AND IssueDate >= ?"
+            params.append(start.strftime(DATE_FORMAT))
+        else:
+            query += " AND IssueDate IS NOT NULL"
+        if end is not None:
+            query += " AND IssueDate < ?"
+            params.append(end.strftime(DATE_FORMAT))
+        query += " ORDER BY IssueDate, TransactionID"
+        return [row for row in self.conn.execute(query, params) if parse_date(row[3]) is not None]
+
+    def get_meta(self, key, default=None):
+        """Returns a value from the Meta table."""
+        row = self.conn.execute("SELECT Value FROM Meta WHERE Key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def meta_items(self):
+        """Returns every key/value in the Meta table as a dict."""
+        return dict(self.conn.execute("SELECT Key, Value FROM Meta"))
+
+    def set_meta(self, key, value):
+        """Sets a value in the Meta table."""
+        self.conn.execute("INSERT OR REPLACE INTO Meta (Key, Value) VALUES (?, ?)", (key, value))
+
+    def generation(self):
+        """Returns a number that changes when another connection commits.
+
+        Callers holding their own derived data (e.g. the catalog index)
+        rebuild it when this changes.
+        """
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def commit(self):
+        """Commits the current SQLite transaction."""
+        self.conn.commit()
+
+    def rollback(self):
+        """Discards the current SQLite transaction."""
+        self.conn.rollback()
+
+    def _busy_error(self):
+        return LockTimeout(f"'{self.filename}' is locked by another process.")
+
+    def begin(self):
+        """Starts a write transaction now, so rows read before an update cannot change underneath it.
+
+        Raises LockTimeout if another process keeps the database locked
+        past the busy timeout.
+        """
+        if not self.conn.in_transaction:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                raise self._busy_error() from e
+
+    def run_with_retry(self, fn, retries=STALE_RETRIES):
+        """Runs fn() inside one write transaction and commits its changes.
+
+        The write lock is taken before fn reads anything, so nothing goes
+        stale; if another process holds the database past the busy timeout
+        the transaction is rolled back and fn runs again, and after the
+        last try LockTimeout is raised, as the Excel engine does. Any other
+        error rolls the transaction back (releasing the write lock) before
+        it is raised. Returns what fn returns.
+        """
+        for attempt in range(retries + 1):
+            try:
+                self.begin()
+                result = fn()
+                self.conn.commit()
+                return result
+            except BaseException as e:
+                self.conn.rollback()
+                busy = isinstance(e, LockTimeout) or (isinstance(e, sqlite3.OperationalError) and "locked" in str(e))
+                if not busy:
+                    raise
+                if attempt == retries:
+                    if isinstance(e, LockTimeout):
+                        raise
+                    raise self._busy_error() from e
+
+    def close(self):
+        """Commits outstanding changes, compacts if needed and closes the connection."""
+        self.conn.commit()
+        self.compact()
+        self.conn.close()
+
+    def data_files(self):
+        """Returns the files that hold this library's data (for backups)."""
+        return [self.filename]
+
+    def begin_checkpoint(self):
+        """SQLite has no journal for the owner to fold in; always None."""
+        return None
+
+    def snapshot_reader(self):
+        """Returns a read-only view of the committed data on a connection of its own.
+
+        The connection may be used from another thread; close() it when done.
+        """
+        return SQLiteReader(self.filename, self.required_sheets)
+
+    def snapshot_data(self):
+        """Returns {file name: contents} with a point-in-time copy of library.db.
+
+        Uses SQLite's online backup on connections of its own, so it is
+        safe to call from a background thread while the desk keeps
+        working.
+        """
+        temp_file = self.filename + ".snapshot"
+        source = sqlite3.connect(self.filename)
+        target = sqlite3.connect(temp_file)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        try:
+            with open(temp_file, "rb") as f:
+                return {self.filename: f.read()}
+        finally:
+            os.remove(temp_file)
+
+    def restore_data(self, files):
+        """Copies a library.db captured by snapshot_data() (or a backup) into the live database.
+
+        Goes through SQLite's online backup rather than replacing the file,
+        so open connections see the restored rows and the database's own
+        locking keeps other processes out while it is copied. Names other
+        than library.db are ignored. Returns the names written.
+        """
+        if files.get(self.filename) is None:
+            return []
+        temp_file = self.filename + ".restore"
+        with open(temp_file, "wb") as f:
+            f.write(files[self.filename])
+        try:
+            self.conn.rollback()
+            source = sqlite3.connect(temp_file)
+            try:
+                source.backup(self.conn)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                raise self._busy_error() from e
+            finally:
+                source.close()
+        finally:
+            os.remove(temp_file)
+        return [self.filename]
+
+    # -------- MIGRATION / EXPORT --------
+    def migrate_from_xlsx(self, xlsx_file=LIBRARY_FILE):
+        """Copies every row of an existing library.xlsx into this database.
+
+        Rows whose ID is not a whole number are skipped, and date cells
+        become the app's 'YYYY-MM-DD' text. The Meta values
+        (report totals, ArchivedMaxTransactionID) come along, and the ID
+        sequences are seeded from library.xlsx.seq and the archive, so no
+        ID handed out before is given out again. Returns a dict of sheet
+        name -> (rows copied, rows skipped).
+        """
+        from storage import LibraryStorage
+
+        source = LibraryStorage(xlsx_file)
+        summary = {}
+        for sheet_name, headers in self.required_sheets.items():
+            copied, skipped = 0, 0
+            placeholders = ", ".join("?" for _ in headers)
+            for row in source.get_rows(sheet_name):
+                try:
+                    row_id = int(row[0])
+                except (TypeError, ValueError):
+                    skipped += 1
+                    continue
+                values = [row_id] + [self._normalize(sheet_name, h, v) for h, v in zip(headers[1:], row[1:])]
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO {sheet_name} ({', '.join(headers)}) VALUES ({placeholders})",
+                    values
+                )
+                copied += 1
+            summary[sheet_name] = (copied, skipped)
+
+        meta = source.meta_items()
+        for key, value in meta.items():
+            # Journal positions only mean something to the Excel engine
+            if key not in XLSX_ONLY_META:
+                self.set_meta(key, value)
+
+        last_ids = source.sequences()
+        archived = int(meta.get("ArchivedMaxTransactionID") or 0)
+        last_ids["Transactions"] = max(int(last_ids.get("Transactions") or 0), archived)
+        for sheet_name, last in last_ids.items():
+            if sheet_name not in self.required_sheets:
+                continue
+            key_column = self._key_column(sheet_name)
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO Sequences (Name, Value) SELECT ?, MAX(?, COALESCE(MAX({key_column}), 0), "
+                f"COALESCE((SELECT Value FROM Sequences WHERE Name = ?), 0)) FROM {sheet_name}",
+                (sheet_name, int(last or 0), sheet_name)
+            )
+        self.conn.commit()
+        return summary
+
+    def export_to_xlsx(self, xlsx_file):
+        """Writes all tables to an .xlsx file laid out like library.xlsx."""
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        for sheet_name, headers in self.required_sheets.items():
+            ws = wb.create_sheet(sheet_name)
+            ws.append(headers)
+            for row in self.get_rows(sheet_name):
+                ws.append(list(row))
+        wb.save(xlsx_file)
+
+
+class SQLiteReader:
+    """Row access on a separate connection; what snapshot_reader() returns."""
+
+    def __init__(self, filename, required_sheets):
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.required_sheets = required_sheets
+
+    def stream_rows(self, sheet_name):
+        """Yields every row of a table as a tuple, ordered by ID."""
+        key = self.required_sheets[sheet_name][0]
+        yield from self.conn.execute(f"SELECT * FROM {sheet_name} ORDER BY {key}")
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "export"):
+        print("Usage: python sqlite_storage.py migrate [library.xlsx] [library.db]")
+        print("       python sqlite_storage.py export [library.db] [library.xlsx]")
+        sys.exit(1)
+
+    if sys.argv[1] == "migrate":
+        xlsx_file = sys.argv[2] if len(sys.argv) > 2 else LIBRARY_FILE
+        db_file = sys.argv[3] if len(sys.argv) > 3 else SQLITE_FILE
+        if not os.path.exists(xlsx_file):
+            print(f"[ERROR] {xlsx_file} not found.")
+            sys.exit(1)
+        storage = SQLiteStorage(db_file)
+        for sheet_name, (copied, skipped) in storage.migrate_from_xlsx(xlsx_file).items():
+            print(f"{sheet_name}: {copied} rows copied, {skipped} skipped")
+        storage.close()
+        print(f"\n[SUCCESS] Migrated {xlsx_file} -> {db_file}")
+    else:
+        db_file = sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+        xlsx_file = sys.argv[3] if len(sys.argv) > 3 else "library_export.xlsx"
+        storage = SQLiteStorage(db_file)
+        storage.export_to_xlsx(xlsx_file)
+        storage.close()
+        print(f"[SUCCESS] Exported {db_file} -> {xlsx_file}")
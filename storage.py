@@ -6,20 +6,54 @@
 #   - Create library.xlsx if it does not exist
 #   - Ensure required sheets exist
 #   - Provide a single workbook instance to all modules
+#   - Cache the parsed workbook process-wide and reload it only
+#     when library.xlsx changes on disk
+#   - Optionally journal row changes to a sidecar log instead of
+#     rewriting library.xlsx on every save (journal mode)
+#   - Expose record-level operations (get_row, add_row, ...) that
+#     the managers use, so the SQLite engine in sqlite_storage.py
+#     can stand in for the workbook
+#   - Delete rows by clearing them in place (tombstones) and compact
+#     sheets once enough of them have built up
+#   - Hand out row IDs from per-sheet sequences kept in a locked
+#     sidecar file (library.xlsx.seq), written by the save that uses them
+#   - Keep several processes from overwriting each other: loads and
+#     saves hold an advisory lock (library.xlsx.lock), a save made
+#     from data another process has since changed is refused with
+#     StaleWorkbookError, and library.xlsx is replaced atomically
+#   - Hand backups a point-in-time copy of the data files
+#   - Let a long-running owner (service.py) checkpoint and read the
+#     whole ledger on a worker thread instead of its event loop
+#
+# Usage:
+#   python storage.py compact [--force]
 # ------------------------------------------------------------
 
 import os
-from openpyxl import Workbook, load_workbook
+import sys
+import json
+
+from indexes import KeyIndex, OpenLoanIndex, DueDateIndex, is_open
+from models import parse_date
+from filelock import FileLock
 
 # -------- CONFIGURATION --------
 LIBRARY_FILE = "library.xlsx"
+SQLITE_FILE = "library.db"
+
+# "excel" or "sqlite"; the LIBRARY_BACKEND environment variable overrides it
+STORAGE_BACKEND = "excel"
+
+# Journal row changes instead of rewriting library.xlsx on every save
+JOURNAL_MODE = True
 
 REQUIRED_SHEETS = {
     "Books": [
         "BookID",
         "Title",
         "Author",
-        "Quantity"
+        "Quantity",
+        "Issued"
     ],
     "Members": [
         "MemberID",
@@ -36,20 +70,100 @@ REQUIRED_SHEETS = {
         "Fine"
     ]
 }
+
+# Hidden sheet holding internal key/value bookkeeping (journal position, ...)
+META_SHEET = "Meta"
+
+# Written just right of a cleared (tombstoned) row, outside the sheet's
+# columns, so the row is still saved to library.xlsx and no row below it
+# (or appended later) changes number across a checkpoint
+DELETED_MARKER = "#deleted"
+
+# Number of journal records written before library.xlsx is rewritten
+CHECKPOINT_EVERY = 50
+
+# Share of cleared (deleted) rows in a sheet at which compaction rewrites it
+COMPACT_THRESHOLD = 0.25
+
+# Times run_with_retry starts over after another process saved first
+STALE_RETRIES = 3
 # -------------------------------
 
+# Parsed workbooks shared by every LibraryStorage instance in this process.
+# Keyed by absolute file path -> (file signature, workbook).
+_workbook_cache = {}
+
+# Row changes made since the last save, keyed like _workbook_cache.
+_pending_ops = {}
+
+# In-memory indexes over the cached workbook, keyed like _workbook_cache,
+# then by (sheet name, index name). Built on first lookup after each load.
+_indexes = {}
+
+# IDs handed out by allocate_ids but not yet saved, keyed like
+# _workbook_cache, then by sheet name -> (sequence value read, last ID).
+_reserved_ids = {}
+
+# Number of times each library file has been (re)loaded from disk.
+_generations = {}
+
+# One cross-process lock per library file, shared by every instance here.
+_locks = {}
+
+
+class StaleWorkbookError(Exception):
+    """Another process saved the library after this copy was loaded.
+
+    The unsaved changes are discarded; run the operation again on the
+    fresh data (LibraryStorage.run_with_retry does this).
+    """
+
+
+def create_storage(backend=None):
+    """Returns the configured storage engine (Excel or SQLite)."""
+    backend = backend or os.environ.get("LIBRARY_BACKEND", STORAGE_BACKEND)
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(SQLITE_FILE)
+    if backend == "excel":
+        return LibraryStorage(LIBRARY_FILE, journal=JOURNAL_MODE)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def prewarm(backend=None):
+    """Loads the configured library into the process-wide cache ahead of first use.
+
+    Meant for a background thread while the user is still logging in.
+    Only the Excel engine has anything to load; a SQLite connection
+    cannot move between threads, so that engine is just imported.
+    """
+    backend = backend or os.environ.get("LIBRARY_BACKEND", STORAGE_BACKEND)
+    if backend == "sqlite":
+        import sqlite_storage
+        return
+    LibraryStorage(LIBRARY_FILE, journal=JOURNAL_MODE).get_workbook()
+
 
 class LibraryStorage:
-    def __init__(self, filename="library.xlsx"):
+    def __init__(self, filename="library.xlsx", journal=False, checkpoint_every=CHECKPOINT_EVERY):
         self.filename = filename
+        self.journal = journal
+        # When True, saves never checkpoint inline; the owner calls
+        # begin/write/end_checkpoint itself (see service.py)
+        self.background_checkpoints = False
+        self.journal_file = filename + ".journal"
+        self.sequence_file = filename + ".seq"
+        self.checkpoint_every = checkpoint_every
         self.required_sheets = {
-            "Books": ["BookID", "Title", "Author", "Quantity"],
+            "Books": ["BookID", "Title", "Author", "Quantity", "Issued"],
             "Members": ["MemberID", "Name", "Phone", "BooksIssued"],
             "Transactions": ["TransactionID", "MemberID", "BookID", "IssueDate", "ReturnDate", "Fine"]
         }
 
     def create_library_file(self):
         """Creates the Excel file if it does NOT exist and initializes sheets."""
+        from openpyxl import Workbook
+
         wb = Workbook()
         # Remove default sheet
         if wb.active:
@@ -58,7 +172,21 @@ class LibraryStorage:
         for sheet_name, headers in self.required_sheets.items():
             ws = wb.create_sheet(sheet_name)
             ws.append(headers)
-        wb.save(self.filename)
+        self._write_file(wb)
+
+    def _write_file(self, wb):
+        """Saves wb to a temp file and renames it over library.xlsx.
+
+        Readers (including other processes) see either the old file or the
+        new one, never a half-written one.
+        """
+        temp_file = self.filename + ".tmp"
+        try:
+            wb.save(temp_file)
+            os.replace(temp_file, self.filename)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
 
     def ensure_sheets_exist(self, wb):
         """Ensures that all required sheets exist inside the workbook."""
@@ -67,17 +195,135 @@ class LibraryStorage:
                 ws = wb.create_sheet(sheet_name)
                 ws.append(headers)
 
+    def upgrade_books_sheet(self, wb):
+        """Adds the Issued column to a Books sheet written before it existed.
+
+        The per-book counters are filled in once from the open loans in
+        the Transactions sheet.
+        """
+        ws = wb["Books"]
+        column = self.required_sheets["Books"].index("Issued") + 1
+        if ws.cell(row=1, column=column).value == "Issued":
+            return
+        ws.cell(row=1, column=column).value = "Issued"
+
+        counts = {}
+        for row in wb["Transactions"].iter_rows(min_row=2, max_col=5, values_only=True):
+            if row[2] is not None and is_open(row[4]):
+                counts[str(row[2])] = counts.get(str(row[2]), 0) + 1
+        for row in ws.iter_rows(min_row=2, max_col=column):
+            if row[0].value is not None:
+                row[column - 1].value = counts.get(str(row[0].value), 0)
+
+    def _cache_key(self):
+        return os.path.abspath(self.filename)
+
+    def _lock(self):
+        """Returns the cross-process lock guarding this library's files."""
+        key = self._cache_key()
+        if key not in _locks:
+            _locks[key] = FileLock(self.filename + ".lock")
+        return _locks[key]
+
+    def _file_signature(self):
+        """Returns the on-disk version stamp of the library, or None if it is missing.
+
+        The stamp is (mtime, size) of library.xlsx and of its journal;
+        every save by any process changes it.
+        """
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        try:
+            jst = os.stat(self.journal_file)
+            journal = (jst.st_mtime_ns, jst.st_size)
+        except FileNotFoundError:
+            journal = None
+        return (st.st_mtime_ns, st.st_size, journal)
+
+    def _is_current(self, wb):
+        """True if wb is the cached workbook and nobody has saved since it was loaded."""
+        cached = _workbook_cache.get(self._cache_key())
+        return cached is not None and cached[1] is wb and cached[0] == self._file_signature()
+
     def get_workbook(self):
-        """Returns a single, consistent workbook instance."""
-        if not os.path.exists(self.filename):
-            self.create_library_file()
-        wb = load_workbook(self.filename)
-        self.ensure_sheets_exist(wb)
+        """Returns a single, consistent workbook instance.
+
+        The parsed workbook is cached and reused until the library
+        changes on disk. While it holds unsaved changes it is kept even
+        then, so an operation never mixes two versions; the save will
+        report the conflict instead.
+        """
+        key = self._cache_key()
+        cached = _workbook_cache.get(key)
+        if cached is not None and (_pending_ops.get(key) or cached[0] == self._file_signature()):
+            return cached[1]
+
+        # openpyxl is imported on first load, not when the app starts
+        from openpyxl import load_workbook
+
+        with self._lock():
+            if not os.path.exists(self.filename):
+                self.create_library_file()
+            signature = self._file_signature()
+            wb = load_workbook(self.filename)
+            self.ensure_sheets_exist(wb)
+            _pending_ops.pop(key, None)
+            _indexes.pop(key, None)
+            replayed = self.replay_journal(wb)
+            self.upgrade_books_sheet(wb)
+            _workbook_cache[key] = (signature, wb)
+            _generations[key] = _generations.get(key, 0) + 1
+
+            # Outside journal mode nothing else will fold the records in.
+            if replayed and not self.journal:
+                self.checkpoint(wb)
         return wb
 
     def save_workbook(self, wb):
-        """Saves the given workbook to disk."""
-        wb.save(self.filename)
+        """Saves the recorded changes to disk.
+
+        In journal mode only the recorded row changes since the last
+        save are written, as one journal record. Raises
+        StaleWorkbookError (and drops the changes) if another process
+        saved after wb was loaded.
+        """
+        key = self._cache_key()
+        if not _pending_ops.get(key):
+            _reserved_ids.pop(key, None)
+            return
+        with self._lock():
+            if not self._is_current(wb) or not self._reservations_current():
+                self.invalidate()
+                raise StaleWorkbookError("The library was changed by another user; please try again.")
+            pending = _pending_ops.pop(key)
+            try:
+                if self.journal:
+                    self._append_journal_record(wb, pending)
+                else:
+                    self._write_file(wb)
+                self._save_reservations()
+            except Exception:
+                # The in-memory copy no longer matches the file; drop it.
+                self.invalidate()
+                raise
+            _workbook_cache[key] = (self._file_signature(), wb)
+
+            if self.journal and not self.background_checkpoints and self._checkpoint_due(wb):
+                self.checkpoint(wb)
+
+    def invalidate(self):
+        """Drops the cached workbook so the next access re-reads the file."""
+        _workbook_cache.pop(self._cache_key(), None)
+        _pending_ops.pop(self._cache_key(), None)
+        _indexes.pop(self._cache_key(), None)
+        _reserved_ids.pop(self._cache_key(), None)
+
+    def refresh(self):
+        """Discards the cached workbook and returns a freshly loaded one."""
+        self.invalidate()
+        return self.get_workbook()
 
     def get_sheet(self, wb, sheet_name):
         """Returns a specific worksheet from the given workbook."""
@@ -86,3 +332,743 @@ class LibraryStorage:
             ws.append(self.required_sheets[sheet_name])
         return wb[sheet_name]
 
+
+    # -------- LOW-LEVEL ROW CHANGES (journaled) --------
+    def _record(self, op):
+        _pending_ops.setdefault(self._cache_key(), []).append(op)
+
+    def _apply_op(self, wb, op, indexes=None):
+        """Applies one recorded change to wb.
+
+        indexes defaults to the cached workbook's indexes; pass () for a
+        workbook of one's own, which they do not describe.
+        """
+        kind = op[0]
+        if kind == "meta":
+            self._write_meta(wb, op[1], op[2])
+            return
+        ws = self.get_sheet(wb, op[1])
+        if indexes is None:
+            indexes = _indexes.get(self._cache_key(), {}).items()
+        indexes = [index for (sheet_name, _), index in indexes if sheet_name == op[1]]
+        if kind == "append":
+            ws.append(op[2])
+            for index in indexes:
+                index.on_append(ws.max_row, op[2])
+        elif kind == "update":
+            ws.cell(row=op[2], column=op[3]).value = op[4]
+            for index in indexes:
+                index.on_update(ws, op[2], op[3], op[4])
+        elif kind == "tombstone":
+            # Clear the row in place; readers already skip empty rows and
+            # no row below it moves.
+            width = len(self.required_sheets[op[1]])
+            old = self._row_values(wb, op[1], op[2])
+            for column in range(1, width + 1):
+                ws.cell(row=op[2], column=column).value = None
+            ws.cell(row=op[2], column=width + 1).value = DELETED_MARKER
+            for index in indexes:
+                index.on_clear(op[2], old)
+        elif kind == "delete":
+            # Written by older versions; kept so their journals replay
+            ws.delete_rows(op[2])
+            for index in indexes:
+                index.on_delete(op[2])
+        elif kind in ("delete_many", "compact"):
+            # Rewrite the sheet once instead of shifting rows per deletion;
+            # empty (tombstoned) rows are dropped along the way.
+            drop = set(op[2]) if kind == "delete_many" else set()
+            width = len(self.required_sheets[op[1]])
+            kept = [list(row) for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_col=width, values_only=True),
+                                                            start=2)
+                    if row_idx not in drop and any(v is not None and v != "" for v in row)]
+            ws.delete_rows(2, ws.max_row)
+            for row in kept:
+                ws.append(row)
+            # Every row number moved; rebuild this sheet's indexes on next use
+            sheet_indexes = _indexes.get(self._cache_key(), {})
+            for name in [name for name in sheet_indexes if name[0] == op[1]]:
+                del sheet_indexes[name]
+
+    def _append(self, wb, sheet_name, values):
+        """Appends a row to a sheet and records it for the next save."""
+        op = ["append", sheet_name, list(values)]
+        self._apply_op(wb, op)
+        self._record(op)
+
+    def _update_cell(self, wb, sheet_name, row, column, value):
+        """Sets a single cell and records it for the next save."""
+        op = ["update", sheet_name, row, column, value]
+        self._apply_op(wb, op)
+        self._record(op)
+
+    def _tombstone_at(self, wb, sheet_name, row):
+        """Clears one row in place (a tombstone) and records it."""
+        op = ["tombstone", sheet_name, row]
+        self._apply_op(wb, op)
+        self._record(op)
+
+    # -------- META --------
+    def _read_meta(self, wb, key, default=None):
+        if META_SHEET not in wb.sheetnames:
+            return default
+        for row in wb[META_SHEET].iter_rows(min_row=2, values_only=True):
+            if row and row[0] == key:
+                return row[1]
+        return default
+
+    def _write_meta(self, wb, key, value):
+        if META_SHEET not in wb.sheetnames:
+            ws = wb.create_sheet(META_SHEET)
+            ws.append(["Key", "Value"])
+            ws.sheet_state = "hidden"
+        ws = wb[META_SHEET]
+        for row in ws.iter_rows(min_row=2):
+            if row[0].value == key:
+                row[1].value = value
+                return
+        ws.append([key, value])
+
+    def get_meta(self, key, default=None):
+        """Returns a value from the hidden Meta sheet.
+
+        Like stream_rows, this does not load the workbook just to answer.
+        """
+        if self._can_stream():
+            for row in self._stream_sheet(META_SHEET, 2):
+                if row[0] == key:
+                    return row[1]
+            return default
+        return self._read_meta(self.get_workbook(), key, default)
+
+    def meta_items(self):
+        """Returns every key/value in the hidden Meta sheet as a dict.
+
+        One read for callers needing several keys; like get_meta, it
+        streams the sheet rather than loading the workbook.
+        """
+        if self._can_stream():
+            return {row[0]: row[1] for row in self._stream_sheet(META_SHEET, 2) if row[0] is not None}
+        wb = self.get_workbook()
+        if META_SHEET not in wb.sheetnames:
+            return {}
+        return {row[0]: row[1] for row in wb[META_SHEET].iter_rows(min_row=2, max_col=2, values_only=True)
+                if row[0] is not None}
+
+    def set_meta(self, key, value):
+        """Sets a value in the hidden Meta sheet and records it for the next save."""
+        op = ["meta", key, value]
+        self._apply_op(self.get_workbook(), op)
+        self._record(op)
+
+    # -------- JOURNAL --------
+    def _append_journal_record(self, wb, ops):
+        """Appends one fsynced record holding the given ops to the journal."""
+        seq = self._read_meta(wb, "JournalSeq", 0) + 1
+        line = json.dumps({"seq": seq, "ops": ops}) + "\n"
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta(wb, "JournalSeq", seq)
+
+    def replay_journal(self, wb, until=None, indexes=None):
+        """Applies journal records newer than the last checkpoint to wb.
+
+        Stops after record `until` if given; indexes is passed on to
+        _apply_op. Returns the number of records replayed. A torn final
+        line left by a crash mid-write is ignored.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        seq = self._read_meta(wb, "JournalSeq", 0)
+        replayed = 0
+        with open(self.journal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["seq"] <= seq:
+                    continue
+                if until is not None and record["seq"] > until:
+                    break
+                for op in record["ops"]:
+                    self._apply_op(wb, op, indexes)
+                seq = record["seq"]
+                replayed += 1
+        self._write_meta(wb, "JournalSeq", seq)
+        return replayed
+
+    def _checkpoint_due(self, wb):
+        seq = self._read_meta(wb, "JournalSeq", 0)
+        return seq - self._read_meta(wb, "CheckpointSeq", 0) >= self.checkpoint_every
+
+    def _truncate_journal(self):
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _journal_pending(self):
+        """True if the journal may hold records not yet in library.xlsx."""
+        return os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > 0
+
+    def checkpoint(self, wb=None):
+        """Writes the full workbook to library.xlsx and empties the journal.
+
+        If another process saved since wb was loaded, the fresh data is
+        loaded and written instead (or StaleWorkbookError is raised if
+        wb still holds unsaved changes).
+        """
+        with self._lock():
+            if wb is None:
+                wb = self.get_workbook()
+            if not self._is_current(wb):
+                if _pending_ops.get(self._cache_key()):
+                    self.invalidate()
+                    raise StaleWorkbookError("The library was changed by another user; please try again.")
+                wb = self.refresh()
+            seq = self._read_meta(wb, "JournalSeq", 0)
+            self._write_meta(wb, "CheckpointSeq", seq)
+            try:
+                self._write_file(wb)
+            except Exception:
+                self.invalidate()
+                raise
+            # Records up to `seq` are now in the xlsx; a crash before this
+            # truncate is harmless because replay skips them.
+            self._truncate_journal()
+            _workbook_cache[self._cache_key()] = (self._file_signature(), wb)
+
+    def begin_checkpoint(self):
+        """Starts a checkpoint whose slow part can run on another thread.
+
+        Returns None unless CHECKPOINT_EVERY journal records have built
+        up since the last one. Otherwise returns a handle for
+        write_checkpoint() (the full-file write, safe on a worker thread
+        while the owner keeps reading) and then end_checkpoint() (back on
+        the owner's thread). Changes saved in between make
+        end_checkpoint() discard the write.
+        """
+        key = self._cache_key()
+        cached = _workbook_cache.get(key)
+        if not self.journal or cached is None or _pending_ops.get(key) or not self._is_current(cached[1]):
+            return None
+        wb = cached[1]
+        if not self._checkpoint_due(wb):
+            return None
+        previous = self._read_meta(wb, "CheckpointSeq", 0)
+        seq = self._read_meta(wb, "JournalSeq", 0)
+        self._write_meta(wb, "CheckpointSeq", seq)
+        return (wb, seq, previous, self.filename + ".checkpoint")
+
+    def write_checkpoint(self, handle):
+        """Writes the data of a begun checkpoint to a temp file.
+
+        The cached workbook is not touched: a workbook of its own is
+        loaded from library.xlsx and the journal records up to the
+        checkpoint, so the owner's thread can go on reading the cached
+        one meanwhile.
+        """
+        from openpyxl import load_workbook
+
+        _, seq, _, temp_file = handle
+        try:
+            wb = load_workbook(self.filename)
+            self.ensure_sheets_exist(wb)
+            self.replay_journal(wb, until=seq, indexes=())
+            if self._read_meta(wb, "JournalSeq", 0) != seq:
+                # Another process checkpointed meanwhile; end_checkpoint() would discard this anyway
+                raise StaleWorkbookError("The library was checkpointed by another process.")
+            self.upgrade_books_sheet(wb)
+            self._write_meta(wb, "CheckpointSeq", seq)
+            wb.save(temp_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def end_checkpoint(self, handle, written=True):
+        """Swaps in the file from write_checkpoint() and empties the journal.
+
+        Nothing is swapped if the write failed, or if anything was saved
+        (by this process or another) since begin_checkpoint(). Returns
+        True if the checkpoint took effect.
+        """
+        wb, seq, previous, temp_file = handle
+        try:
+            with self._lock():
+                if written and self._is_current(wb) and self._read_meta(wb, "JournalSeq", 0) == seq:
+                    os.replace(temp_file, self.filename)
+                    self._truncate_journal()
+                    _workbook_cache[self._cache_key()] = (self._file_signature(), wb)
+                    return True
+                if self._is_current(wb):
+                    self._write_meta(wb, "CheckpointSeq", previous)
+                else:
+                    self.invalidate()
+                return False
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def close(self):
+        """Folds any outstanding journal records into library.xlsx.
+
+        Sheets whose share of deleted rows has reached COMPACT_THRESHOLD
+        are compacted on the way.
+        """
+        cached = _workbook_cache.get(self._cache_key())
+        if cached is not None:
+            wb = cached[1]
+        elif self._journal_pending():
+            wb = self.get_workbook()    # replays the journal
+        else:
+            return
+        if self.tombstone_stats():
+            self.run_with_retry(self.compact)
+            wb = self.get_workbook()
+        if self._read_meta(wb, "JournalSeq", 0) != self._read_meta(wb, "CheckpointSeq", 0):
+            self.checkpoint(wb)
+
+    # -------- RECORD API (shared with SQLiteStorage) --------
+    def _column(self, sheet_name, header):
+        return self.required_sheets[sheet_name].index(header) + 1
+
+    def _get_index(self, wb, sheet_name, name, factory):
+        """Returns a named index over a sheet, building it on first use."""
+        indexes = _indexes.setdefault(self._cache_key(), {})
+        if (sheet_name, name) not in indexes:
+            indexes[(sheet_name, name)] = factory().build(self.get_sheet(wb, sheet_name))
+        return indexes[(sheet_name, name)]
+
+    def _key_index(self, wb, sheet_name):
+        """Returns the ID -> row index for a sheet."""
+        return self._get_index(wb, sheet_name, "key", KeyIndex)
+
+    def _open_loan_index(self, wb):
+        """Returns the index of open loans in the Transactions sheet."""
+        return self._get_index(wb, "Transactions", "open", OpenLoanIndex)
+
+    def _due_date_index(self, wb):
+        """Returns the issue-date ordered index of open loans."""
+        return self._get_index(wb, "Transactions", "due", DueDateIndex)
+
+    def _row_values(self, wb, sheet_name, row_idx):
+        ws = self.get_sheet(wb, sheet_name)
+        width = len(self.required_sheets[sheet_name])
+        return next(ws.iter_rows(min_row=row_idx, max_row=row_idx, max_col=width, values_only=True))
+
+    def _find_row_index(self, wb, sheet_name, key):
+        """Returns the sheet row number holding the given ID, or None."""
+        return self._key_index(wb, sheet_name).get(key)
+
+    def get_rows(self, sheet_name):
+        """Yields every non-empty row of a sheet as a tuple."""
+        wb = self.get_workbook()
+        ws = self.get_sheet(wb, sheet_name)
+        width = len(self.required_sheets[sheet_name])
+        for row in ws.iter_rows(min_row=2, max_col=width, values_only=True):
+            if any(row):
+                yield row
+
+    def _can_stream(self):
+        """True if reads should stream library.xlsx instead of loading it.
+
+        That is when the workbook is not already in memory (and current)
+        and the journal holds nothing the xlsx lacks.
+        """
+        key = self._cache_key()
+        cached = _workbook_cache.get(key)
+        if cached is not None and (_pending_ops.get(key) or cached[0] == self._file_signature()):
+            return False
+        return not self._journal_pending() and os.path.exists(self.filename)
+
+    def _stream_sheet(self, sheet_name, width):
+        """Yields the non-empty rows of one sheet read straight from disk (read-only mode)."""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(self.filename, read_only=True)
+        try:
+            if sheet_name not in wb.sheetnames:
+                return
+            for row in wb[sheet_name].iter_rows(min_row=2, max_col=width, values_only=True):
+                if any(v is not None and v != "" for v in row):
+                    yield tuple(row) + (None,) * (width - len(row))
+        finally:
+            wb.close()
+
+    def stream_rows(self, sheet_name):
+        """Yields every non-empty row of a sheet without loading the workbook.
+
+        Used by read-only paths such as reports. If the workbook is
+        already cached it is read from memory; otherwise only the one
+        sheet is streamed from disk in openpyxl's read-only mode, so
+        memory stays flat however large the sheet grows. Journal
+        records that are not yet in the xlsx force a normal load so
+        they are not missed.
+        """
+        if not self._can_stream():
+            yield from self.get_rows(sheet_name)
+            return
+        yield from self._stream_sheet(sheet_name, len(self.required_sheets[sheet_name]))
+
+    def get_row(self, sheet_name, key):
+        """Returns the row whose ID (first column) equals key, or None."""
+        wb = self.get_workbook()
+        row_idx = self._find_row_index(wb, sheet_name, key)
+        if row_idx is None:
+            return None
+        return self._row_values(wb, sheet_name, row_idx)
+
+    def add_row(self, sheet_name, values):
+        """Appends a new row."""
+        self._append(self.get_workbook(), sheet_name, values)
+
+    def add_rows(self, sheet_name, rows):
+        """Appends many rows at once."""
+        wb = self.get_workbook()
+        for values in rows:
+            self._append(wb, sheet_name, values)
+
+    def update_row(self, sheet_name, key, changes):
+        """Updates the named columns of the row with the given ID.
+
+        Returns False if no such row exists.
+        """
+        wb = self.get_workbook()
+        row_idx = self._find_row_index(wb, sheet_name, key)
+        if row_idx is None:
+            return False
+        for header, value in changes.items():
+            self._update_cell(wb, sheet_name, row_idx, self._column(sheet_name, header), value)
+        return True
+
+    def delete_row(self, sheet_name, key):
+        """Deletes the row with the given ID. Returns False if not found.
+
+        The row is cleared in place rather than removed, so no other row
+        moves; compact() later drops the empty rows in one pass.
+        """
+        wb = self.get_workbook()
+        row_idx = self._find_row_index(wb, sheet_name, key)
+        if row_idx is None:
+            return False
+        self._tombstone_at(wb, sheet_name, row_idx)
+        return True
+
+    def delete_rows(self, sheet_name, keys):
+        """Deletes every row whose ID is in keys, rewriting the sheet once.
+
+        Returns the number of rows deleted.
+        """
+        wb = self.get_workbook()
+        index = self._key_index(wb, sheet_name)
+        rows = sorted({index.get(key) for key in keys} - {None})
+        if rows:
+            op = ["delete_many", sheet_name, rows]
+            self._apply_op(wb, op)
+            self._record(op)
+        return len(rows)
+
+    def tombstone_stats(self, threshold=COMPACT_THRESHOLD):
+        """Returns {sheet: (deleted rows, total rows)} for sheets at or over threshold.
+
+        Pass threshold=0 to list every sheet with deleted rows.
+        """
+        wb = self.get_workbook()
+        stats = {}
+        for sheet_name in self.required_sheets:
+            total = self.get_sheet(wb, sheet_name).max_row - 1
+            deleted = total - len(self._key_index(wb, sheet_name))
+            if deleted > 0 and deleted >= threshold * total:
+                stats[sheet_name] = (deleted, total)
+        return stats
+
+    def compact(self, threshold=COMPACT_THRESHOLD):
+        """Rewrites every sheet whose share of deleted rows reached threshold.
+
+        Each sheet is rewritten once without its empty rows, the change is
+        committed, and in journal mode library.xlsx is checkpointed so the
+        file itself shrinks. Returns {sheet: deleted rows removed}.
+        """
+        stats = self.tombstone_stats(threshold)
+        if not stats:
+            return {}
+        wb = self.get_workbook()
+        for sheet_name in stats:
+            op = ["compact", sheet_name, []]
+            self._apply_op(wb, op)
+            self._record(op)
+        self.commit()
+        if self.journal:
+            self.checkpoint()
+        return {sheet_name: deleted for sheet_name, (deleted, _) in stats.items()}
+
+    # -------- ID SEQUENCES --------
+    def _read_sequences(self):
+        try:
+            with open(self.sequence_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_sequences(self, sequences):
+        temp_file = self.sequence_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(sequences, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.sequence_file)
+
+    def sequences(self):
+        """Returns {sheet: last ID handed out} from library.xlsx.seq."""
+        with FileLock(self.sequence_file + ".lock"):
+            return self._read_sequences()
+
+    def _max_numeric_id(self, sheet_name):
+        index = self._key_index(self.get_workbook(), sheet_name)
+        return max((int(key) for key in index.rows if key.isdigit()), default=0)
+
+    def allocate_ids(self, sheet_name, count=1, start=1):
+        """Reserves count consecutive IDs for a sheet and returns the first.
+
+        The last ID handed out per sheet is kept in library.xlsx.seq, so
+        allocation costs the same however large the sheet is. The
+        reservation is only written there by the save that commits it:
+        a save refused as stale or a rollback hands the IDs back, and a
+        save whose sequence file moved on since the IDs were reserved is
+        refused as stale, so two processes never keep the same ID. The
+        first allocation for a sheet starts after the highest ID already
+        in it; no ID below start is ever returned.
+        """
+        reserved = _reserved_ids.setdefault(self._cache_key(), {})
+        if sheet_name in reserved:
+            base, last = reserved[sheet_name]
+        else:
+            base = self.sequences().get(sheet_name)
+            last = self._max_numeric_id(sheet_name) if base is None else base
+        first = max(last + 1, start)
+        reserved[sheet_name] = (base, first + count - 1)
+        return first
+
+    def _reservations_current(self):
+        """True unless the sequence file moved on since this process reserved IDs from it."""
+        reserved = _reserved_ids.get(self._cache_key())
+        if not reserved:
+            return True
+        sequences = self.sequences()
+        return all(sequences.get(sheet_name) == base for sheet_name, (base, _) in reserved.items())
+
+    def _save_reservations(self):
+        """Writes the IDs reserved in this save to library.xlsx.seq. Called under the library lock."""
+        reserved = _reserved_ids.pop(self._cache_key(), None)
+        if not reserved:
+            return
+        with FileLock(self.sequence_file + ".lock"):
+            sequences = self._read_sequences()
+            for sheet_name, (_, last) in reserved.items():
+                sequences[sheet_name] = last
+            self._write_sequences(sequences)
+
+    def last_id(self, sheet_name):
+        """Returns the ID in the last non-empty row, or None if the sheet is empty."""
+        ws = self.get_sheet(self.get_workbook(), sheet_name)
+        for row_idx in range(ws.max_row, 1, -1):
+            value = ws.cell(row=row_idx, column=1).value
+            if value is not None and value != "":
+                return value
+        return None
+
+    def find_open_transaction(self, member_id, book_id):
+        """Returns the open (unreturned) transaction for a member/book pair, or None."""
+        wb = self.get_workbook()
+        row_idx = self._open_loan_index(wb).find(member_id, book_id)
+        if row_idx is None:
+            return None
+        return self._row_values(wb, "Transactions", row_idx)
+
+    def has_open_transactions(self, member_id):
+        """Returns True if the member still has a book issued."""
+        return self._open_loan_index(self.get_workbook()).open_count(member_id) > 0
+
+    def generation(self):
+        """Returns a number that changes whenever the data is reloaded from disk.
+
+        Callers holding their own derived data (e.g. the catalog index)
+        rebuild it when this changes.
+        """
+        self.get_workbook()
+        return _generations[self._cache_key()]
+
+    def get_open_transactions(self):
+        """Returns every open (unreturned) transaction, oldest first.
+
+        Served by the open-loan index once the workbook is loaded;
+        before that the sheet is streamed instead of loaded for it.
+        """
+        if self._can_stream():
+            return [row for row in self.stream_rows("Transactions")
+                    if (row[0] is not None or row[1] is not None) and is_open(row[4])]
+        wb = self.get_workbook()
+        index = self._open_loan_index(wb)
+        return [self._row_values(wb, "Transactions", row_idx) for row_idx in sorted(index.open_rows)]
+
+    def get_open_transactions_issued_between(self, start=None, end=None):
+        """Returns open transactions issued on or after start and before end, oldest first.
+
+        start and end are dates (either may be None). Loans whose IssueDate
+        cannot be read are not returned. Like get_open_transactions, an
+        unloaded workbook is streamed rather than loaded.
+        """
+        if self._can_stream():
+            loans = []
+            for position, row in enumerate(self.stream_rows("Transactions")):
+                is_loan = (row[0] is not None or row[1] is not None) and is_open(row[4])
+                issued = parse_date(row[3]) if is_loan else None
+                if issued is not None and (start is None or issued >= start) and (end is None or issued < end):
+                    loans.append((issued, position, row))
+            return [row for _, _, row in sorted(loans, key=lambda loan: loan[:2])]
+        wb = self.get_workbook()
+        rows = self._due_date_index(wb).rows_issued_between(start, end)
+        return [self._row_values(wb, "Transactions", row_idx) for row_idx in rows]
+
+    def commit(self):
+        """Persists all changes made through the record API.
+
+        Raises StaleWorkbookError if another process saved first.
+        """
+        cached = _workbook_cache.get(self._cache_key())
+        if cached is not None:
+            self.save_workbook(cached[1])
+
+    def begin(self):
+        """Marks the start of a change. Conflicts are caught at save time, so nothing to do."""
+
+    def run_with_retry(self, fn, retries=STALE_RETRIES):
+        """Runs fn() and commits its changes, starting over on fresh data if stale.
+
+        fn must change data only through this storage and be safe to run
+        again after a refused save. Any other error rolls back what fn
+        changed before it is raised, so a later commit cannot save half
+        an operation. Returns what fn returns.
+        """
+        for attempt in range(retries + 1):
+            try:
+                self.begin()
+                result = fn()
+                self.commit()
+                return result
+            except StaleWorkbookError:
+                if attempt == retries:
+                    raise
+            except BaseException:
+                self.rollback()
+                raise
+
+    def rollback(self):
+        """Discards uncommitted changes by reloading the data from disk."""
+        self.invalidate()
+
+    def data_files(self):
+        """Returns the files that hold this library's data (for backups)."""
+        return [self.filename]
+
+    def snapshot_reader(self):
+        """Returns a read-only view of the data as it is now, for another thread.
+
+        It reads the in-memory workbook, so the caller must make no
+        changes until the reader is closed.
+        """
+        return WorkbookReader(self.get_workbook(), self.required_sheets)
+
+    def snapshot_data(self):
+        """Returns {file name: contents or None} for library.xlsx and its sidecars.
+
+        The files are read under the library lock, so the copy is one
+        point in time with no save halfway through. A fresh lock handle
+        is used, so this is safe to call from a background thread.
+        """
+        files = {}
+        with FileLock(self.filename + ".lock"):
+            for name in (self.filename, self.journal_file, self.sequence_file):
+                try:
+                    with open(name, "rb") as f:
+                        files[name] = f.read()
+                except FileNotFoundError:
+                    files[name] = None
+        return files
+
+    def restore_data(self, files):
+        """Writes back files captured by snapshot_data() (or restored from a backup).
+
+        files is {file name: contents}; names this engine does not own are
+        ignored. The writes happen under the library lock and the cached
+        workbook is dropped afterwards, so nothing loaded before the
+        restore can be saved over it. Returns the names written.
+        """
+        restored = []
+        with self._lock():
+            if files.get(self.filename) is not None:
+                self._replace_file(self.filename, files[self.filename])
+                restored.append(self.filename)
+                # A journal left over from current data must not be replayed onto the restored file
+                if files.get(self.journal_file) is None:
+                    self._truncate_journal()
+            if files.get(self.journal_file) is not None:
+                self._replace_file(self.journal_file, files[self.journal_file])
+                restored.append(self.journal_file)
+            # A newer sequence file is kept otherwise: it only makes IDs skip ahead
+            if files.get(self.sequence_file) is not None:
+                with FileLock(self.sequence_file + ".lock"):
+                    self._replace_file(self.sequence_file, files[self.sequence_file])
+                restored.append(self.sequence_file)
+            self.invalidate()
+        return restored
+
+    @staticmethod
+    def _replace_file(target, data):
+        temp_file = target + ".restore"
+        with open(temp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, target)
+
+
+class WorkbookReader:
+    """Row access to one loaded workbook, without LibraryStorage's cache and locks.
+
+    What LibraryStorage.snapshot_reader() hands to a worker thread.
+    """
+
+    def __init__(self, wb, required_sheets):
+        self.wb = wb
+        self.required_sheets = required_sheets
+
+    def stream_rows(self, sheet_name):
+        """Yields every non-empty row of a sheet."""
+        if sheet_name not in self.wb.sheetnames:
+            return
+        width = len(self.required_sheets[sheet_name])
+        for row in self.wb[sheet_name].iter_rows(min_row=2, max_col=width, values_only=True):
+            if any(row):
+                yield row
+
+    def close(self):
+        self.wb = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python storage.py compact [--force]")
+        sys.exit(1)
+
+    storage = create_storage()
+    removed = storage.compact(0 if "--force" in sys.argv else COMPACT_THRESHOLD)
+    if not removed:
+        print("[INFO] Nothing to compact.")
+    for name, count in removed.items():
+        print(f"{name}: {count} removed")
+    storage.close()
@@ -0,0 +1,64 @@
+# test_storage.py
+# ------------------------------------------------------------
+# Journal replay checks for the Excel storage engine.
+#
+# Usage:
+#   python -m pytest -q test_storage.py
+#   python -m unittest test_storage
+# ------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from storage import LibraryStorage
+
+
+class JournalReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.old_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+        self.storage = LibraryStorage("library.xlsx", journal=True)
+
+    def tearDown(self):
+        self.storage.invalidate()
+        os.chdir(self.old_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def reopen(self):
+        """Forgets everything in memory and loads the file plus journal, as a fresh process would."""
+        self.storage.invalidate()
+        return LibraryStorage("library.xlsx", journal=True)
+
+    def test_changes_after_checkpointed_tombstone_replay_onto_same_rows(self):
+        storage = self.storage
+        storage.run_with_retry(lambda: storage.add_rows("Books", [[101, "A", "x", 5, 0],
+                                                                  [102, "B", "y", 5, 0],
+                                                                  [103, "C", "z", 5, 0]]))
+        # The deleted row is the last one, so the checkpoint writes it as the file's last row
+        storage.run_with_retry(lambda: storage.delete_row("Books", 103))
+        storage.checkpoint()
+        storage.run_with_retry(lambda: storage.add_row("Books", [104, "New", "w", 5, 0]))
+        storage.run_with_retry(lambda: storage.update_row("Books", 104, {"Quantity": 4, "Issued": 1}))
+        self.assertEqual(storage.get_row("Books", 104), (104, "New", "w", 4, 1))
+
+        reopened = self.reopen()
+        self.assertEqual(reopened.get_row("Books", 104), (104, "New", "w", 4, 1))
+        self.assertEqual([row[0] for row in reopened.get_rows("Books")], [101, 102, 104])
+
+    def test_compact_drops_tombstoned_rows(self):
+        storage = self.storage
+        storage.run_with_retry(lambda: storage.add_rows("Books", [[101, "A", "x", 5, 0],
+                                                                  [102, "B", "y", 5, 0]]))
+        storage.run_with_retry(lambda: storage.delete_row("Books", 101))
+        self.assertEqual(storage.compact(threshold=0), {"Books": 1})
+
+        reopened = self.reopen()
+        self.assertEqual(list(reopened.get_rows("Books")), [(102, "B", "y", 5, 0)])
+        self.assertEqual(reopened.tombstone_stats(threshold=0), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,21 @@
 # transactions.py
-import os
 from datetime import datetime
-from openpyxl import load_workbook
-from models import Transaction
+from archive import TransactionArchiver
+from aggregates import ReportAggregates
+from storage import StaleWorkbookError
+from filelock import LockTimeout
+
+class BatchRejected(Exception):
+    """An atomic batch had a failing item and must not be saved.
+
+    Raised only when the caller saves the batch itself (commit=False);
+    results holds the per-item outcome.
+    """
+
+    def __init__(self, results):
+        super().__init__("Batch not applied: at least one item failed.")
+        self.results = results
+
 
 class TransactionManager:
     def __init__(self, storage):
@@ -10,17 +23,14 @@ class TransactionManager:
         self.sheet_name = "Transactions"
         self.fine_per_day = 10
         self.due_days = 7
+        self.archiver = TransactionArchiver(storage)
+        self.aggregates = ReportAggregates(storage)
 
-    def generate_transaction_id(self, ws):
-        """Generates a new incremental Transaction ID."""
-        last_row = ws.max_row
-        if last_row <= 1:
-            return 1
-        last_id = ws.cell(row=last_row, column=1).value
-        try:
-            return int(last_id) + 1
-        except (TypeError, ValueError):
-            return 1
+    def generate_transaction_id(self):
+        """Allocates a new incremental Transaction ID."""
+        # IDs moved to the archive must not be handed out again
+        archived_id = int(self.storage.get_meta("ArchivedMaxTransactionID", 0) or 0)
+        return self.storage.allocate_ids(self.sheet_name, start=archived_id + 1)
 
     def calculate_fine(self, issue_date_str, return_date_str):
         """Calculates fine based on due days and daily fine rate."""
@@ -35,57 +45,34 @@ class TransactionManager:
         except (ValueError, TypeError):
             return 0
 
-    def issue_book(self):
-        """Issues a book to a member and records the transaction."""
-        member_id = input("Enter Member ID: ")
-        book_id = input("Enter Book ID: ")
+    def _issue(self, member_id, book_id, issue_date):
+        """Applies one issue without saving.
 
-        wb = self.storage.get_workbook()
-        ws_trans = self.storage.get_sheet(wb, self.sheet_name)
-        
+        Returns (transaction ID, None), or (None, reason) if it cannot be issued.
+        """
         # Check if Member exists
-        if "Members" in wb.sheetnames:
-            ws_members = wb["Members"]
-            member_found = False
-            for row in ws_members.iter_rows(min_row=2, values_only=True):
-                if not any(row): continue
-                if str(row[0]) == member_id:
-                    member_found = True
-                    break
-            if not member_found:
-                print(f"\n[ERROR] Member ID {member_id} not found!")
-                return
+        if self.storage.get_row("Members", member_id) is None:
+            return None, f"Member ID {member_id} not found!"
 
         # Check if Book exists AND has Stock
-        if "Books" in wb.sheetnames:
-            ws_books = wb["Books"]
-            book_found = False
-            book_row_obj = None
-            for row in ws_books.iter_rows(min_row=2):
-                if not any(cell.value for cell in row): continue
-                stored_id = row[0].value
-                quantity = row[3].value
-                if str(stored_id) == book_id:
-                    book_found = True
-                    if quantity > 0:
-                        book_row_obj = row
-                    else:
-                        print(f"\n[ERROR] Book ID {book_id} is out of stock!")
-                        return
-                    break
-            if not book_found:
-                print(f"\n[ERROR] Book ID {book_id} not found!")
-                return
-        
+        book_row = self.storage.get_row("Books", book_id)
+        if book_row is None:
+            return None, f"Book ID {book_id} not found!"
+        current_qty = book_row[3] or 0
+        if current_qty <= 0:
+            return None, f"Book ID {book_id} is out of stock!"
+
         # Decrease Stock
-        current_qty = book_row_obj[3].value
-        book_row_obj[3].value = current_qty - 1
+        self.storage.update_row("Books", book_id, {
+            "Quantity": current_qty - 1,
+            "Issued": (book_row[4] or 0) + 1
+        })
 
         # Issue the Book
-        transaction_id = self.generate_transaction_id(ws_trans)
-        issue_date = datetime.today().strftime("%Y-%m-%d")
+        transaction_id = self.generate_transaction_id()
+        self.aggregates.record_issue(member_id)
 
-        ws_trans.append([
+        self.storage.add_row(self.sheet_name, [
             transaction_id,
             member_id,
             book_id,
@@ -93,56 +80,167 @@ class TransactionManager:
             "",     # ReturnDate empty
             0       # Fine 0
         ])
+        return transaction_id, None
 
+    def _return(self, member_id, book_id, return_date):
+        """Applies one return without saving.
+
+        Returns (fine, None), or (None, reason) if there is no open loan.
+        """
+        trans_row = self.storage.find_open_transaction(member_id, book_id)
+        if trans_row is None:
+            return None, "No matching active transaction found."
+
+        fine = self.calculate_fine(trans_row[3], return_date)
+        self.aggregates.record_return(trans_row[1], fine)
+        self.storage.update_row(self.sheet_name, trans_row[0], {"ReturnDate": return_date, "Fine": fine})
+
+        # Update stock
+        book_row = self.storage.get_row("Books", book_id)
+        if book_row is not None:
+            self.storage.update_row("Books", book_id, {
+                "Quantity": (book_row[3] or 0) + 1,
+                "Issued": max((book_row[4] or 0) - 1, 0)
+            })
+        return fine, None
+
+    def _run_batch(self, items, apply, atomic, commit):
+        """Applies apply(member, book, today) to every item and saves once.
+
+        Returns one dict per item: member_id, book_id, ok, result (the
+        value returned by apply) and error. With atomic=True nothing is
+        saved unless every item succeeds. With commit=False the caller
+        saves (or rolls back) the changes itself.
+        """
+        if not commit:
+            return self._apply_batch(items, apply, atomic)
         try:
-            self.storage.save_workbook(wb)
-            print("\n[SUCCESS] Book issued successfully.")
-            print(f"Transaction ID: {transaction_id}")
-            print(f"Issue Date: {issue_date}\n")
+            # Another process saving first makes the whole batch run again on fresh data;
+            # a rejected batch is rolled back by run_with_retry
+            return self.storage.run_with_retry(lambda: self._apply_batch(items, apply, atomic))
+        except BatchRejected as e:
+            return e.results
+
+    def _apply_batch(self, items, apply, atomic):
+        """Applies every item without saving; raises BatchRejected if atomic and one fails."""
+        today = datetime.today().strftime("%Y-%m-%d")
+        results = []
+        for member_id, book_id in items:
+            result, error = apply(str(member_id), str(book_id), today)
+            results.append({"member_id": member_id, "book_id": book_id,
+                            "ok": error is None, "result": result, "error": error})
+
+        if atomic and not all(item["ok"] for item in results):
+            for item in results:
+                if item["ok"]:
+                    item["ok"], item["result"] = False, None
+                    item["error"] = "Not applied: another item in the batch failed."
+            raise BatchRejected(results)
+        return results
+
+    def issue_books(self, items, atomic=False, commit=True):
+        """Issues many (member ID, book ID) pairs with a single save.
+
+        Each item is checked against the data as left by the items before
+        it, so stock runs out part-way through a batch exactly as it would
+        one issue at a time. result holds the new Transaction ID.
+        """
+        return self._run_batch(items, self._issue, atomic, commit)
+
+    def return_books(self, items, atomic=False, commit=True):
+        """Returns many (member ID, book ID) pairs with a single save.
+
+        result holds the fine charged for each returned book.
+        """
+        return self._run_batch(items, self._return, atomic, commit)
+
+    def issue_book(self):
+        """Issues a book to a member and records the transaction."""
+        member_id = input("Enter Member ID: ")
+        book_id = input("Enter Book ID: ")
+
+        issue_date = datetime.today().strftime("%Y-%m-%d")
+        try:
+            # Validated and applied again if another desk saved in between
+            transaction_id, error = self.storage.run_with_retry(
+                lambda: self._issue(member_id, book_id, issue_date))
         except PermissionError:
             print("\n[ERROR] Close the Excel file 'library.xlsx' and try again!")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}")
+            return
+
+        if error:
+            print(f"\n[ERROR] {error}")
+            return
+        print("\n[SUCCESS] Book issued successfully.")
+        print(f"Transaction ID: {transaction_id}")
+        print(f"Issue Date: {issue_date}\n")
 
     def return_book(self):
         """Returns a book by locating matching active transaction."""
         member_id = input("Enter Member ID: ")
         book_id = input("Enter Book ID: ")
 
-        wb = self.storage.get_workbook()
-        ws = self.storage.get_sheet(wb, self.sheet_name)
-
-        found = False
         return_date = datetime.today().strftime("%Y-%m-%d")
+        try:
+            fine, error = self.storage.run_with_retry(lambda: self._return(member_id, book_id, return_date))
+        except PermissionError:
+            print("\n[ERROR] Close the Excel file 'library.xlsx' and try again!")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}")
+            return
+
+        if error:
+            print(f"\n[INFO] {error}\n")
+            return
+        print("\n[SUCCESS] Book returned successfully.")
+        print(f"Return Date: {return_date}")
+        print(f"Fine: Rs. {fine}\n")
 
-        for row in ws.iter_rows(min_row=2):
-            if not any(cell.value for cell in row): continue
-            stored_member = str(row[1].value)
-            stored_book = str(row[2].value)
-            issue_date = row[3].value
-            return_date_cell = row[4].value
-
-            if (stored_member == member_id and stored_book == book_id and 
-                (return_date_cell is None or return_date_cell == "")):
-                
-                fine = self.calculate_fine(issue_date, return_date)
-                row[4].value = return_date
-                row[5].value = fine
-
-                # Update stock
-                if "Books" in wb.sheetnames:
-                    ws_books = wb["Books"]
-                    for b_row in ws_books.iter_rows(min_row=2):
-                        if str(b_row[0].value) == book_id:
-                            b_row[3].value = (b_row[3].value or 0) + 1
-                            break
-                found = True
-                self.storage.save_workbook(wb)
-                print("\n[SUCCESS] Book returned successfully.")
-                print(f"Return Date: {return_date}")
-                print(f"Fine: Rs. {fine}\n")
+    def batch_menu(self, returning=False):
+        """Reads Member ID, Book ID pairs (one per line) and issues or returns them together."""
+        action = "return" if returning else "issue"
+        print(f"Enter one 'MemberID, BookID' per line to {action}; leave a line empty to finish.")
+        items = []
+        while True:
+            line = input("> ").strip()
+            if not line:
                 break
+            parts = [part.strip() for part in line.replace(";", ",").split(",")]
+            if len(parts) != 2 or not all(parts):
+                print("[ERROR] Expected: MemberID, BookID")
+                continue
+            items.append((parts[0], parts[1]))
+        if not items:
+            print("\n[INFO] Nothing entered.\n")
+            return
+        atomic = input("Apply all or nothing? (y/n): ").strip().lower() == "y"
+
+        try:
+            if returning:
+                results = self.return_books(items, atomic)
+            else:
+                results = self.issue_books(items, atomic)
+        except PermissionError:
+            print("\n[ERROR] Close the Excel file 'library.xlsx' and try again!")
+            return
+        except (StaleWorkbookError, LockTimeout) as e:
+            print(f"\n[ERROR] {e}")
+            return
 
-        if not found:
-            print("\n[INFO] No matching active transaction found.\n")
+        print()
+        for item in results:
+            if not item["ok"]:
+                print(f"[ERROR] Member {item['member_id']} / Book {item['book_id']}: {item['error']}")
+            elif returning:
+                print(f"[SUCCESS] Member {item['member_id']} / Book {item['book_id']}: returned, Fine: Rs. {item['result']}")
+            else:
+                print(f"[SUCCESS] Member {item['member_id']} / Book {item['book_id']}: Transaction ID {item['result']}")
+        done = sum(1 for item in results if item["ok"])
+        print(f"\n{done} of {len(results)} book(s) {action}d.\n")
 
     def transactions_menu(self):
         """Displays Transactions menu."""
@@ -150,7 +248,10 @@ class TransactionManager:
             print("TRANSACTIONS MENU")
             print("1. Issue Book")
             print("2. Return Book")
-            print("3. Back to Main Menu")
+            print("3. Batch Issue (Class Visit)")
+            print("4. Batch Return")
+            print("5. Archive Closed Transactions")
+            print("6. Back to Main Menu")
 
             choice = input("Enter choice: ")
             if choice == "1":
@@ -158,6 +259,12 @@ class TransactionManager:
             elif choice == "2":
                 self.return_book()
             elif choice == "3":
+                self.batch_menu()
+            elif choice == "4":
+                self.batch_menu(returning=True)
+            elif choice == "5":
+                self.archiver.archive_menu()
+            elif choice == "6":
                 break
             else:
                 print("\n[ERROR] Invalid choice. Try again.\n")